@@ -0,0 +1,432 @@
+#Benchmarks for the traffic data processing program (cw_a_b_c.py)
+#Run "python benchmark.py --help" for the available benchmarks.
+
+import argparse
+import asyncio
+import collections
+import csv
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+
+try: # resource only exists on Unix, peak memory is not measured elsewhere
+    import resource
+except ImportError:
+    resource = None
+
+from cw_a_b_c import (DEFAULT_METRICS, MetricEngine, process_csv_data, process_csv_data_with_histogram, read_csv_records,
+                      read_records, RESULT_FORMATS, ResultsWriter, TrafficRecord)
+
+# Stages of the program that are benchmarked, each one is run in a fresh process
+STAGES = ("process_csv_data", "process_csv_data_with_histogram", "save_results_to_file")
+DEFAULT_SIZES = (10000, 100000, 1000000)
+SAVE_ROWS_PER_RESULT = 1000 # The save stage saves the results of one survey day per 1000 rows of the size
+
+# Synthetic survey data
+
+CSV_COLUMNS = ["JunctionName", "Date", "timeOfDay", "travel_Direction_in", "travel_Direction_out",
+               "Weather_Conditions", "JunctionSpeedLimit", "VehicleSpeed", "VehicleType", "elctricHybrid"]
+SPEED_LIMITS = {"Elm Avenue/Rabbit Road": 20, "Hanley Highway/Westway": 30}
+VEHICLE_WEIGHTS = {"Car": 50, "Truck": 10, "Buss": 5, "Bicycle": 8, "Motorcycle": 6, "Scooter": 5, "Van": 10, "Taxi": 6}
+WEATHER = ["Clear", "Cloudy", "Fog", "Light Rain", "Heavy Rain", "Snow"]
+
+def generate_traffic_csv(file_name, rows, seed=0, date=datetime.date(2024, 6, 15)):
+    """
+    Writes a realistic traffic_data*.csv file with the same columns as the real surveys.
+    The same seed and row count always give the same file. Rows are spread over the day in
+    time order with a morning and an evening peak, the weather changes every few hours and
+    speeds are spread around the junction's speed limit. Rows are written in batches, so
+    files of tens of millions of rows can be made without much memory.
+
+    Parameters:
+    file_name (str): File to write.
+    rows (int): Number of vehicles.
+    seed (int): Seed of the random generator.
+    date (datetime.date): Survey date written in the Date column.
+    """
+    generator = random.Random(seed)
+    junctions = list(SPEED_LIMITS)
+    vehicle_types = list(VEHICLE_WEIGHTS)
+    vehicle_weights = list(VEHICLE_WEIGHTS.values())
+    weather = [generator.choice(WEATHER) for block in range(8)] # One weather per 3 hour block
+    # More traffic in the rush hours, used to spread the rows over the day
+    hour_weights = [1, 1, 1, 1, 2, 4, 8, 12, 12, 8, 6, 6, 6, 6, 6, 7, 10, 12, 10, 6, 4, 3, 2, 1]
+    hour_rows = [rows * weight // sum(hour_weights) for weight in hour_weights]
+    hour_rows[17] += rows - sum(hour_rows)
+    survey_date = date.strftime("%d/%m/%Y")
+
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS)
+        for hour, count in enumerate(hour_rows):
+            vehicles_per_second = [0] * 3600 # Counted instead of sorting a list of every row's second
+            for vehicle in range(count):
+                vehicles_per_second[generator.randrange(3600)] += 1
+            batch = []
+            for second in (second for second, vehicles in enumerate(vehicles_per_second) for vehicle in range(vehicles)):
+                junction = generator.choice(junctions)
+                limit = SPEED_LIMITS[junction]
+                batch.append([junction, survey_date, f"{hour:02d}:{second // 60:02d}:{second % 60:02d}",
+                              generator.choice("NESW"), generator.choice("NESW"), weather[hour // 3], limit,
+                              max(1, int(generator.gauss(limit, 6))),
+                              generator.choices(vehicle_types, vehicle_weights)[0],
+                              "True" if generator.random() < 0.2 else "False"])
+                if len(batch) == 10000:
+                    writer.writerows(batch)
+                    batch = []
+            writer.writerows(batch)
+
+def benchmark_file(rows, seed, data_directory):
+    """
+    Returns the generated file for a size and seed, generating it only once.
+    """
+    file_name = os.path.join(data_directory, f"traffic_data_{rows}_{seed}.csv")
+    if not os.path.exists(file_name):
+        generate_traffic_csv(file_name + ".tmp", rows, seed)
+        os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+# Stage benchmarks
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in MB, or None where it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1) # bytes on macOS, KB on Linux
+
+def run_save_stage(rows):
+    """
+    Saves the results of one survey day per SAVE_ROWS_PER_RESULT rows through ResultsWriter in every
+    format, so the work grows with the size. The outcomes come from a small generated file and only
+    the saving is timed, so the peak memory is not the one left over from processing a large file.
+
+    Returns:
+    dict: wall_seconds, peak_rss_mb and the number of results saved.
+    """
+    results = max(1, rows // SAVE_ROWS_PER_RESULT)
+    with tempfile.TemporaryDirectory() as directory:
+        sample_file = os.path.join(directory, "traffic_data15062024.csv")
+        generate_traffic_csv(sample_file, SAVE_ROWS_PER_RESULT)
+        outcomes = process_csv_data(sample_file)
+        first_day = datetime.date(2024, 1, 1)
+        survey_files = [f"traffic_data{first_day + datetime.timedelta(days=day):%d%m%Y}.csv" for day in range(results)]
+        start = time.perf_counter()
+        with ResultsWriter(os.path.join(directory, "results.txt"), RESULT_FORMATS) as writer:
+            for survey_file in survey_files:
+                writer.add(outcomes, survey_file)
+        wall = time.perf_counter() - start
+    return {"wall_seconds": wall, "peak_rss_mb": peak_rss_mb(), "results": results}
+
+def run_stage(stage, file_name, rows):
+    """
+    Runs one stage on a file in this process and returns its wall time and peak memory.
+    Used by the child processes started by benchmark_stages.
+    """
+    if stage == "save_results_to_file":
+        return run_save_stage(rows)
+    function = {"process_csv_data": process_csv_data, "process_csv_data_with_histogram": process_csv_data_with_histogram}[stage]
+    start = time.perf_counter()
+    function(file_name)
+    wall = time.perf_counter() - start
+    return {"wall_seconds": wall, "peak_rss_mb": peak_rss_mb()}
+
+def benchmark_stages(sizes=DEFAULT_SIZES, stages=STAGES, seed=0, data_directory=None):
+    """
+    Benchmarks every stage on generated files of every size.
+    Each measurement runs in a new Python process, so the peak memory belongs to that stage alone.
+
+    Returns:
+    list: One dictionary per size and stage with rows, wall_seconds, rows_per_second and peak_rss_mb.
+    The save stage has results (the number of survey days saved) instead of rows_per_second.
+    """
+    if data_directory is None:
+        data_directory = os.path.join(tempfile.gettempdir(), "traffic_benchmark_data")
+    os.makedirs(data_directory, exist_ok=True)
+    results = []
+    for rows in sizes:
+        file_name = benchmark_file(rows, seed, data_directory)
+        for stage in stages:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "stage", stage, file_name, "--rows", str(rows)],
+                                    capture_output=True, text=True, check=True).stdout
+            measurement = json.loads(output.strip().splitlines()[-1])
+            measurement.update(rows=rows, stage=stage, file_bytes=os.path.getsize(file_name))
+            if "results" in measurement: # The save stage does not read the rows, so rows/s would mean nothing
+                rate = f"{measurement['results']:>12} results"
+            else:
+                measurement["rows_per_second"] = round(rows / measurement["wall_seconds"]) if measurement["wall_seconds"] else None
+                rate = f"{measurement['rows_per_second'] or 0:>12} rows/s"
+            results.append(measurement)
+            print(f"{rows:>10} {stage:<32} {measurement['wall_seconds']:9.3f}s {rate} {measurement['peak_rss_mb']} MB")
+    return results
+
+def save_benchmark(results, output_file, seed):
+    """
+    Writes the benchmark results to a JSON file together with details of the machine.
+    """
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "platform": platform.platform(), "seed": seed, "results": results}
+    with open(output_file, 'w') as file:
+        json.dump(report, file, indent=2)
+
+def compare_benchmarks(old_file, new_file):
+    """
+    Prints the change in wall time and peak memory of every stage between two result files.
+    Positive percentages are slower or bigger in the new file.
+    """
+    with open(old_file, 'r') as file:
+        old = {(result["rows"], result["stage"]): result for result in json.load(file)["results"]}
+    with open(new_file, 'r') as file:
+        new = json.load(file)["results"]
+    for result in new:
+        before = old.get((result["rows"], result["stage"]))
+        if before is None:
+            continue
+        wall_change = (result["wall_seconds"] / before["wall_seconds"] - 1) * 100 if before["wall_seconds"] else 0
+        memory = ""
+        if result["peak_rss_mb"] and before["peak_rss_mb"]:
+            memory = f"{(result['peak_rss_mb'] / before['peak_rss_mb'] - 1) * 100:+6.1f}% memory"
+        print(f"{result['rows']:>10} {result['stage']:<32} {wall_change:+6.1f}% time {memory}")
+
+# Metric engine benchmark
+
+VEHICLE_TYPES = ["car", "truck", "buss", "bicycle", "motorcycle", "scooter", "van", "taxi"]
+JUNCTIONS = ["Elm Avenue/Rabbit Road", "Hanley Highway/Westway"]
+DIRECTIONS = ["n", "s", "e", "w"]
+
+def make_metrics(count):
+    """
+    Builds count extra metric definitions on top of DEFAULT_METRICS: filtered counts,
+    counts per junction and filtered hourly histograms, like a deployment with many junctions would add.
+    """
+    metrics = list(DEFAULT_METRICS)
+    for number in range(count):
+        where = {"vehicle_type": VEHICLE_TYPES[number % len(VEHICLE_TYPES)],
+                 "direction_in": DIRECTIONS[(number // len(VEHICLE_TYPES)) % len(DIRECTIONS)]}
+        if number % 3 == 0:
+            metrics.append({"name": f"extra_{number}", "kind": "count", "where": dict(where, junction=JUNCTIONS[number % len(JUNCTIONS)])})
+        elif number % 3 == 1:
+            metrics.append({"name": f"extra_{number}", "kind": "count", "where": where, "group_by": "junction"})
+        else:
+            metrics.append({"name": f"extra_{number}", "kind": "hourly", "where": {"electric": number % 2 == 0}, "group_by": "junction"})
+    return metrics
+
+def benchmark_metric_engine(file_name, metric_counts=(0, 10, 50, 100, 200), repeats=3):
+    """
+    Measures the per-row cost of MetricEngine as the number of metrics grows.
+    The records are read once beforehand, so only the metric evaluation is timed.
+
+    Returns:
+    list: (number of metrics, nanoseconds per row) for each entry of metric_counts, best of repeats.
+    """
+    records = list(read_records(file_name))
+    results = []
+    for count in metric_counts:
+        metrics = make_metrics(count)
+        best = None
+        for repeat in range(repeats):
+            engine = MetricEngine(metrics)
+            start = time.perf_counter()
+            engine.add_records(records)
+            engine.results()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((len(metrics), best / len(records) * 1e9))
+    return results
+
+# Memory of the row pipeline types
+
+def read_csv_rows(file_name):
+    """
+    The old first stage of the reading pipeline, kept to compare against: yields one
+    csv.DictReader row (column name -> value) at a time.
+    """
+    with open(file_name, 'r') as file: #https://docs.python.org/3/library/csv.html#csv.DictReader
+        for row in csv.DictReader(file):
+            yield row
+
+def normalise_rows(rows):
+    """
+    The old second stage of the reading pipeline: cleans the fields of each row from
+    read_csv_rows into a record, making new strings for every row.
+    """
+    for row in rows:
+        yield TrafficRecord(row["VehicleType"].strip().lower(),
+               row["elctricHybrid"].strip().lower() == "true",
+               row["JunctionName"].strip(),
+               row["travel_Direction_in"].strip().lower(),
+               row["travel_Direction_out"].strip().lower(),
+               int(row["VehicleSpeed"]),
+               int(row["JunctionSpeedLimit"]),
+               row["timeOfDay"].split(":")[0], # Extract only the hour from time
+               row["Weather_Conditions"].strip().lower())
+
+def traced_memory(function):
+    """
+    Runs function with tracemalloc on.
+
+    Returns:
+    tuple: (bytes still allocated by the result, peak bytes while it ran)
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current, peak
+
+def benchmark_memory(file_name, rows=100000, copies=10000):
+    """
+    Compares the memory of the old representations (DictReader rows, tuples of fresh strings,
+    lists of outcomes and dictionaries of hourly counts) with the new ones (TrafficRecord,
+    TrafficOutcomes and HourlyHistogram) on a survey file.
+
+    Returns:
+    list: (what was measured, old bytes, new bytes)
+    """
+    results = []
+    old, peak = traced_memory(lambda: list(itertools.islice(read_csv_rows(file_name), rows)))
+    new, peak = traced_memory(lambda: list(itertools.islice(read_csv_records(file_name), rows)))
+    results.append((f"{rows} rows kept (DictReader dicts / TrafficRecords)", old, new))
+    old, peak = traced_memory(lambda: list(itertools.islice(normalise_rows(read_csv_rows(file_name)), rows)))
+    results.append((f"{rows} rows kept (normalised tuples / TrafficRecords)", old, new))
+
+    # Streaming a file only keeps one row at a time, the peak shows what a row costs on the way
+    current, old = traced_memory(lambda: collections.deque(normalise_rows(read_csv_rows(file_name)), maxlen=0))
+    current, new = traced_memory(lambda: collections.deque(read_csv_records(file_name), maxlen=0))
+    results.append(("peak while streaming the file", old, new))
+
+    outcomes, hourly_counts_elm, hourly_counts_hanley = process_csv_data_with_histogram(file_name)
+    old, peak = traced_memory(lambda: [list(outcomes) for copy in range(copies)])
+    new, peak = traced_memory(lambda: [type(outcomes)(*outcomes) for copy in range(copies)])
+    results.append((f"{copies} outcomes (list / TrafficOutcomes)", old, new))
+    old, peak = traced_memory(lambda: [dict(hourly_counts_elm) for copy in range(copies)])
+    new, peak = traced_memory(lambda: [type(hourly_counts_elm)(hourly_counts_elm) for copy in range(copies)])
+    results.append((f"{copies} hourly histograms (dict / HourlyHistogram)", old, new))
+    return results
+
+# Load test of the query service (python cw_a_b_c.py --serve)
+
+async def load_client(host, port, path, requests, latencies, errors):
+    """
+    Sends requests one after the other over a single keep-alive connection and records their latencies.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for number in range(requests):
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+def benchmark_service(url, requests=1000, concurrency=20):
+    """
+    Sends requests to a running query service from concurrency connections at the same time.
+
+    Returns:
+    dict: Requests per second, latency percentiles in milliseconds and the number of failed requests.
+    """
+    url = urllib.parse.urlsplit(url)
+    path = url.path + (f"?{url.query}" if url.query else "")
+    latencies = []
+    errors = []
+
+    async def run_clients():
+        per_client = [requests // concurrency + (1 if number < requests % concurrency else 0) for number in range(concurrency)]
+        await asyncio.gather(*(load_client(url.hostname, url.port or 80, path, count, latencies, errors) for count in per_client if count))
+
+    start = time.perf_counter()
+    asyncio.run(run_clients())
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    percentile = lambda fraction: round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+    return {"requests": len(latencies), "errors": len(errors), "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(latencies) / elapsed), "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95), "p99_ms": percentile(0.99)}
+
+def main(arguments=None):
+    """
+    Runs the benchmark chosen on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for the traffic data processing program")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stages_parser = commands.add_parser("stages", help="rows/s, wall time and peak memory of each stage on generated files")
+    stages_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="row counts, e.g. 10000 1000000 50000000")
+    stages_parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    stages_parser.add_argument("--seed", type=int, default=0)
+    stages_parser.add_argument("--data-dir", help="folder for the generated files, reused between runs")
+    stages_parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    generate_parser = commands.add_parser("generate", help="write a synthetic traffic_data*.csv file")
+    generate_parser.add_argument("file")
+    generate_parser.add_argument("rows", type=int)
+    generate_parser.add_argument("--seed", type=int, default=0)
+    compare_parser = commands.add_parser("compare", help="compare two JSON result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    stage_parser = commands.add_parser("stage", help=argparse.SUPPRESS) # Used by "stages" in a child process
+    stage_parser.add_argument("stage", choices=STAGES)
+    stage_parser.add_argument("file")
+    stage_parser.add_argument("--rows", type=int, default=0, help="rows of the file, sets the number of results the save stage writes")
+    metrics_parser = commands.add_parser("metrics", help="per-row cost of the metric engine as the number of metrics grows")
+    metrics_parser.add_argument("file", help="survey file (CSV or .tdc) used as input")
+    metrics_parser.add_argument("--counts", type=int, nargs="+", default=[0, 10, 50, 100, 200], help="numbers of extra metrics")
+    memory_parser = commands.add_parser("memory", help="memory of the old and new row, outcome and histogram types")
+    memory_parser.add_argument("file", help="survey CSV file used as input")
+    memory_parser.add_argument("--rows", type=int, default=100000, help="rows kept in memory for the comparison")
+    load_parser = commands.add_parser("load", help="requests per second and latency of a running query service")
+    load_parser.add_argument("url", help="e.g. http://127.0.0.1:8080/day?date=15/06/2024")
+    load_parser.add_argument("--requests", type=int, default=1000)
+    load_parser.add_argument("--concurrency", type=int, default=20, help="connections sending requests at the same time")
+    args = parser.parse_args(arguments)
+
+    if args.command == "stages":
+        results = benchmark_stages(args.sizes, args.stages, args.seed, args.data_dir)
+        save_benchmark(results, args.output, args.seed)
+        print(f"Results saved to {args.output}")
+    elif args.command == "generate":
+        generate_traffic_csv(args.file, args.rows, args.seed)
+    elif args.command == "compare":
+        compare_benchmarks(args.old, args.new)
+    elif args.command == "stage":
+        print(json.dumps(run_stage(args.stage, args.file, args.rows)))
+    elif args.command == "metrics":
+        print("metrics  ns/row")
+        for metrics, nanoseconds in benchmark_metric_engine(args.file, args.counts):
+            print(f"{metrics:7d}  {nanoseconds:6.0f}")
+    elif args.command == "memory":
+        print(f"{'':56} {'old':>12} {'new':>12} {'change':>8}")
+        for what, old, new in benchmark_memory(args.file, args.rows):
+            print(f"{what:56} {old / 1024 / 1024:9.2f} MB {new / 1024 / 1024:9.2f} MB {(new / old - 1) * 100 if old else 0:+7.1f}%")
+    elif args.command == "load":
+        print(json.dumps(benchmark_service(args.url, args.requests, args.concurrency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
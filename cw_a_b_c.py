@@ -2,7 +2,46 @@
 #Date: 21/11/2024
 #Student ID: IIT - 20240830 | UOW - 21197457
 
+import argparse
+import array
+import asyncio
+import bisect
+import collections
+import contextlib
+import copy
+import cProfile
 import csv
+import datetime
+import glob
+import hashlib
+import html
+import http
+import io
+import itertools
+import json
+import locale
+import mmap
+import multiprocessing
+import os
+import pstats
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import fcntl
+except ImportError: # Not available on Windows, results files are then replaced without a lock
+    fcntl = None
+
+try: # NumPy is optional, it is only needed by the columnar backend
+    import numpy as np
+except ImportError:
+    np = None
 
 # Task A: Input Validation
 
@@ -76,380 +115,3054 @@ def validate_continue_input():
         else:
             print("Invalid input. Please enter Y/N.")  # Shows error for invalid input
 
+# Instrumentation
+
+class PipelineStats:
+    """
+    Timers and counters for the stages of processing a file: opening it, parsing the CSV,
+    evaluating the metrics, writing the report and drawing the histogram, with optional
+    cProfile and tracemalloc capture.
+    It is switched on with --stats or the TRAFFIC_STATS environment variable. When it is
+    off, stage() returns an empty context manager and rows are not wrapped at all, so it
+    adds nothing to the row loop.
+    """
+    def __init__(self, enabled=False, profile=False, trace_memory=False):
+        """
+        Initializes the statistics of one run.
+        """
+        self.enabled = enabled
+        self.profile = profile and enabled
+        self.trace_memory = trace_memory and enabled
+        self.files = [] # Statistics of every processed file
+        self.current = None # Statistics of the file being processed
+        self.profiler = cProfile.Profile() if self.profile else None
+        self.started = time.time()
+
+    @classmethod
+    def from_environment(cls, enabled=False, profile=False, trace_memory=False):
+        """
+        Creates the statistics from TRAFFIC_STATS, e.g. TRAFFIC_STATS=1 or TRAFFIC_STATS=profile,memory.
+        The arguments (the --stats, --profile and --trace-memory options) switch them on even when the variable is not set.
+        """
+        options = [option.strip() for option in os.environ.get("TRAFFIC_STATS", "").lower().split(",") if option.strip() not in ("", "0")]
+        profile = profile or "profile" in options
+        trace_memory = trace_memory or "memory" in options
+        return cls(enabled or profile or trace_memory or bool(options), profile, trace_memory)
+
+    def start_file(self, file_name):
+        """
+        Starts collecting the statistics of a file.
+        """
+        if not self.enabled:
+            return
+        self.current = {"file": file_name, "bytes": os.path.getsize(file_name) if os.path.exists(file_name) else 0,
+                        "rows": 0, "stages": {}}
+        self.files.append(self.current)
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def finish_file(self):
+        """
+        Stops collecting the statistics of the current file.
+        """
+        if not self.enabled or self.current is None:
+            return
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            self.current["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.current["top_allocations"] = [{"where": str(statistic.traceback[0]), "bytes": statistic.size}
+                                               for statistic in snapshot.statistics("lineno")[:10]]
+            tracemalloc.stop()
+        self.current = None
+
+    def stage(self, name):
+        """
+        Returns a context manager that adds the time spent inside it to a stage of the current file.
+        """
+        if not self.enabled or self.current is None:
+            return contextlib.nullcontext()
+        return self.timed_stage(name)
+
+    @contextlib.contextmanager
+    def timed_stage(self, name):
+        """
+        Times a stage, used by stage() when the statistics are on.
+        """
+        stages = self.current["stages"]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages[name] = stages.get(name, 0) + time.perf_counter() - start
+
+    def counted_records(self, records):
+        """
+        Wraps the records of the current file to count them and time the reading and parsing.
+        The parse time is taken out of the "evaluate" stage the records are consumed in.
+        Records pass through untouched when the statistics are off.
+        """
+        if not self.enabled or self.current is None:
+            return records
+        return self.timed_records(records, self.current)
+
+    def timed_records(self, records, current):
+        """
+        Generator behind counted_records.
+        """
+        parse_time = 0
+        rows = 0
+        records = iter(records)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    record = next(records)
+                except StopIteration:
+                    break
+                finally:
+                    parse_time += time.perf_counter() - start
+                rows += 1
+                yield record
+        finally:
+            stages = current["stages"]
+            stages["parse"] = stages.get("parse", 0) + parse_time
+            stages["evaluate"] = stages.get("evaluate", 0) - parse_time
+            current["rows"] += rows
+
+    def summary(self):
+        """
+        Returns the statistics of the run as a dictionary that can be saved as JSON.
+        """
+        totals = {}
+        for file_stats in self.files:
+            for name, seconds in file_stats["stages"].items():
+                totals[name] = totals.get(name, 0) + seconds
+        summary = {"started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                   "files": self.files, "rows": sum(file_stats["rows"] for file_stats in self.files),
+                   "bytes": sum(file_stats["bytes"] for file_stats in self.files), "stages": totals}
+        if self.profiler is not None:
+            profile = pstats.Stats(self.profiler).sort_stats("cumulative")
+            summary["profile"] = [{"function": pstats.func_std_string(function), "calls": calls, "cumulative_seconds": cumulative}
+                                  for function, (primitive, calls, total, cumulative, callers) in
+                                  sorted(profile.stats.items(), key=lambda item: item[1][3], reverse=True)[:20]]
+        return summary
+
+    def write(self, results_file="results.txt"):
+        """
+        Saves the summary as run_stats.json next to the results file (and the profile as run_profile.prof).
+        """
+        if not self.enabled:
+            return
+        directory = os.path.dirname(os.path.abspath(results_file))
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(directory, "run_profile.prof"))
+        stats_file = os.path.join(directory, "run_stats.json")
+        with open(stats_file + ".tmp", 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+        os.replace(stats_file + ".tmp", stats_file)
+
+NO_STATS = PipelineStats() # Switched off, used when no statistics are wanted
+
+
 # Task B: Processed Outcomes
 
-def process_csv_data(file_name):
+# Fields of a normalised record and the CSV column each one is read from
+RECORD_COLUMNS = (("vehicle_type", "VehicleType"), ("electric", "elctricHybrid"), ("junction", "JunctionName"),
+                  ("direction_in", "travel_Direction_in"), ("direction_out", "travel_Direction_out"),
+                  ("speed", "VehicleSpeed"), ("speed_limit", "JunctionSpeedLimit"), ("hour", "timeOfDay"),
+                  ("weather", "Weather_Conditions"))
+
+# One survey row with its fields cleaned and parsed. A named tuple has no __dict__
+# (its __slots__ is empty), so it is as small as a plain tuple and record[0] still works.
+TrafficRecord = collections.namedtuple("TrafficRecord", [field for field, column in RECORD_COLUMNS]) #https://docs.python.org/3/library/collections.html#collections.namedtuple
+
+class MalformedRowError(ValueError):
     """
-    Processes traffic data from a CSV file to compute various metrics, such as:
-    Total number of vehicles, trucks, electric vehicles, and two-wheeled vehicles.
-    Buses traveling north at a specific junction.
-    Vehicles that didn't turn and those exceeding the speed limit.
-    Junction-specific vehicle counts and hourly traffic patterns.
-    Hours with rain and busiest traffic hour.
-    
-    Parameters:
-    file_name (str): Name of the CSV file to process.
+    A row of a survey file that does not pass validation. column is the CSV column at fault
+    ("row" when the row itself is broken) and reason says what is wrong with it.
+    """
+    def __init__(self, column, reason):
+        super().__init__(f"{column}: {reason}")
+        self.column = column
+        self.reason = reason
 
-    Returns:
-    list: Computed metrics or None if the file is not found.
+# Validation and cleaning of the fields of a row, a ValueError marks a malformed value
+
+def clean_category(value):
+    return value.strip().lower()
+
+def clean_required_category(value):
+    value = value.strip().lower()
+    if not value:
+        raise ValueError("the value is empty")
+    return value
+
+def clean_junction(value):
+    value = value.strip()
+    if not value:
+        raise ValueError("the value is empty")
+    return value
+
+def clean_electric(value):
+    value = value.strip().lower()
+    if value not in ("true", "false"):
+        raise ValueError(f"{value!r} is not True or False")
+    return value == "true"
+
+def clean_whole_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{value!r} is not a whole number") from None
+
+def clean_hour(hour):
     """
-    
-    try: #https://docs.python.org/3/library/csv.html#csv.DictReader
-        with open(file_name, 'r') as file:
-            csv_reader = csv.DictReader(file) # Read the CSV data into dictionaries
-            data = list(csv_reader) # convert it into list
-
-        # Check if the file is empty or not formatted properly
-        if not data:
-            print(f"Error: The file '{file_name}' is empty or not formatted properly.")
-            return None
+    Checks the hour part of a time such as "07:15:00".
+    """
+    if not (hour.isdigit() and int(hour) < 24):
+        raise ValueError(f"{hour!r} is not an hour from 00 to 23")
+    return hour
 
-        # Variables that are assigned
-        total_vehicles = 0
-        total_trucks = 0
-        electric_vechiles = 0
-        two_wheeled_vehicles = 0
-        buses_north = 0
-        no_turn = 0
-        total_bicycles = 0
-        over_speed = 0
-        elm_junction = 0
-        hanley_junction = 0
-        scooter_count = 0
-        rain_hours = set() # Creating an empty set to store because set doesn't allow duplicates
-        hourly_counts = {} # Dictionary to store the hourly traffic count
-        
-        # Process the records
-        for row in data:
-            total_vehicles += 1
-            vehicle_type = row["VehicleType"].strip().lower()
-            
-            # Total number of Trucks and its percentage
-            if vehicle_type == "truck":
-                total_trucks += 1
-                # Equation to find the truck percentage
-                truck_percentage = round ((total_trucks / total_vehicles) * 100) if total_vehicles > 0 else 0
-                
-            # Total number of Electric vehicles
-            if row["elctricHybrid"].strip().lower() == "true":
-                electric_vechiles += 1
-                
-            # Total number of Two wheeled vehicles
-            if vehicle_type in ["bicycle", "motorcycle", "scooter"]:
-                two_wheeled_vehicles += 1
-                
-            # Buses goes in north at Elm avenue
-            if row["JunctionName"].strip() == "Elm Avenue/Rabbit Road" and row["travel_Direction_out"].strip().lower() == "n" and vehicle_type == "buss":
-                buses_north += 1
-                
-            # Vehicles that didn't turn
-            if row["travel_Direction_in"].strip().lower() == row["travel_Direction_out"].strip().lower():
-                no_turn += 1
-            
-            # Total number of bicycle and find average
-            if vehicle_type == "bicycle":
-                total_bicycles += 1
-                # Equation to find the average bicycle per hour
-                average_bicycles_per_hour = round(total_bicycles / 24) if total_bicycles > 0 else 0
-                
-            # Over speeded vehicles
-            if int(row["VehicleSpeed"]) > int(row["JunctionSpeedLimit"]):
-                over_speed += 1
-                
-            # Vehicles per junction
-            if row["JunctionName"].strip() == "Elm Avenue/Rabbit Road":
-                elm_junction += 1
-                if vehicle_type == "scooter":
-                    scooter_count += 1
-                    # Equation to find the scooter percentage
-                    scooter_percentage = round((scooter_count / elm_junction) * 100) if elm_junction > 0 else 0
-            elif row["JunctionName"].strip() == "Hanley Highway/Westway":
-                hanley_junction += 1
-            
-            
-            # Vehicle counts per hour for Hanley Highway/Westway
-            if row["JunctionName"].strip() == "Hanley Highway/Westway":
-                hour = row["timeOfDay"].split(":")[0]  # Extract only the hour from time
-                hourly_counts[hour] = hourly_counts.get(hour, 0) + 1  # Increment count for this hour
-
-            # Find the busiest hour specifically for Hanley Highway/Westway
-            busiest_hour = max(hourly_counts.values(), default=0)
-            busiest_hour_times = [f"Between {hour}:00 and {int(hour) + 1}:00" for hour, count in hourly_counts.items() if count == busiest_hour]
-            
-            # Record hours with rain
-            hour = row["timeOfDay"].split(":")[0]  # Extract hour
-            if "rain" in row["Weather_Conditions"].strip().lower(): # search for the word rain in the row
-                rain_hours.add(hour)
-        
-        
-        # Results are stored as list
-        return [ total_vehicles, total_trucks, electric_vechiles, two_wheeled_vehicles, buses_north, no_turn, over_speed,
-                 elm_junction, hanley_junction, truck_percentage, average_bicycles_per_hour, scooter_percentage, 
-                 busiest_hour, ",".join(busiest_hour_times),len(rain_hours) ]
-    
-    
-    # Output when the there is no such file is found    
-    except FileNotFoundError:
-        print(f"Error: File '{file_name}' not found.")
-        return None 
+class InternedValues(dict):
+    """
+    Cleans each distinct raw value of a column once and hands out the same object afterwards,
+    e.g. every " Truck" of a file becomes one shared "truck". The columns only have a few
+    distinct values, so after the first rows a field costs one dictionary lookup and no new string.
+    A value the cleaning rejects raises MalformedRowError for the column and is not kept.
+    """
+    __slots__ = ("clean", "column")
 
-def display_outcomes(outcomes, file_name):
+    def __init__(self, clean, column):
+        """
+        clean is the function that turns a raw value into the stored one, column the CSV column it checks.
+        """
+        super().__init__()
+        self.clean = clean
+        self.column = column
+
+    def __missing__(self, raw):
+        try:
+            value = self[raw] = self.clean(raw)
+        except ValueError as e:
+            raise MalformedRowError(self.column, str(e)) from None
+        return value
+
+QUARANTINE_DIR = "quarantine" # Folder of the rows that failed validation, one CSV file per survey file
+
+class RowQuarantine:
     """
-    Displays the calculated outcomes in a clear and formatted way.
+    Collects the rows of a survey file that fail validation, so a bad value only costs its own
+    row instead of the whole day. The rows are written with their line number and the reason
+    to quarantine/<survey file>.csv, which replaces the file of an earlier run when close() is
+    called (and is removed once the survey file has no bad rows any more).
+    With directory None the rows are only kept in memory, e.g. for a .tdc file, which has none.
     """
-    print(f"\n***************************")
-    print(f"Data file selected is {file_name}")
-    print(f"***************************")
-    print(f"The total number of vehicles recorded for this date is {outcomes[0]}")
-    print(f"The total number of trucks recorded for this date is {outcomes[1]}")
-    print(f"The total number of electric vehicles for this date is {outcomes[2]}")
-    print(f"The total number of two-wheeled vehicles for this date is {outcomes[3]}")
-    print(f"The total number of Busses leaving Elm Avenue/Rabbit Road heading North is {outcomes[4]}")
-    print(f"The total number of Vehicles through both junctions not turning left or right is {outcomes[5]}")
-    print(f"The percentage of total vehicles recorded that are trucks for this date is {outcomes[9]}%")
-    print(f"the average number of Bikes per hour for this date is {outcomes[10]}")
-    print(f"The total number of Vehicles recorded as over the speed limit for this date is {outcomes[6]}")
-    print(f"The total number of vehicles recorded through Elm Avenue/Rabbit Road junction is {outcomes[7]}")
-    print(f"The total number of vehicles recorded through Hanley Highway/Westway junction is {outcomes[8]}")
-    print(f"{outcomes[11]}% of vehicles recorded through Elm Avenue/Rabbit Road are scooters.")
-    print(f"The highest number of vehicles in an hour on Hanley Highway/Westway is {outcomes[12]}")
-    print(f"The most vehicles through Hanley Highway/Westway were recorded between {outcomes[13]}")
-    print(f"The number of hours of rain for this date is {outcomes[14]}")
+    def __init__(self, file_name, directory=QUARANTINE_DIR, name=None):
+        """
+        Initializes an empty quarantine for a survey file.
+        name is the file name in directory, by default the survey file name with the .csv extension.
+        """
+        self.file_name = file_name
+        self.directory = directory
+        self.name = name or os.path.splitext(os.path.basename(file_name))[0] + ".csv"
+        self.count = 0 # Rows quarantined
+        self.reasons = {} # Column -> rows quarantined because of it
+        self.rows = [] # (line, column, reason, fields) not written yet
+        self.lines_read = 0 # Last line number the parser reached
+        self.temp_file = None
+        self.writer = None
+
+    def output_file(self):
+        """
+        Returns the quarantine file of the survey file, e.g. quarantine/traffic_data15062024.csv.
+        """
+        return os.path.join(self.directory, self.name)
 
+    def add(self, line, column, reason, fields):
+        """
+        Quarantines one row.
+        """
+        self.count += 1
+        self.reasons[column] = self.reasons.get(column, 0) + 1
+        self.rows.append((line, column, reason, fields))
+        if self.directory is not None and len(self.rows) >= 10000: # Do not keep a file full of bad rows in memory
+            self.flush()
 
-# Task C: Save Results to Text File
+    def add_file(self, quarantine_file, line_offset=0):
+        """
+        Quarantines the rows saved by another quarantine (e.g. of a chunk counted in a pool process),
+        moving their line numbers on by line_offset. The file is read one row at a time.
+        """
+        with open(quarantine_file, newline="") as file:
+            reader = csv.reader(file)
+            next(reader, None) # Header
+            for line, column, reason, row in reader:
+                self.add(int(line) + line_offset, column, reason, next(csv.reader([row]), []))
+
+    def flush(self):
+        """
+        Writes the collected rows to the temporary quarantine file.
+        """
+        if not self.rows:
+            return
+        if self.temp_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.temp_file = open(f"{self.output_file()}.{os.getpid()}.tmp", 'w', newline="")
+            self.writer = csv.writer(self.temp_file)
+            self.writer.writerow(["line", "column", "reason", "row"])
+        for line, column, reason, fields in self.rows:
+            row = io.StringIO()
+            csv.writer(row, lineterminator="").writerow(fields) # The row as it was in the survey file
+            self.writer.writerow([line, column, reason, row.getvalue()])
+        self.rows = []
+
+    def close(self):
+        """
+        Saves the quarantine file, or removes the one of an earlier run when every row was valid.
+        """
+        if self.directory is None:
+            return
+        self.flush()
+        if self.temp_file is not None:
+            self.temp_file.close()
+            os.replace(self.temp_file.name, self.output_file())
+            self.temp_file = None
+        elif os.path.exists(self.output_file()):
+            os.remove(self.output_file())
 
-def save_results_to_file(outcomes, fileName="results.txt", csv_file=None):
+    def discard(self):
+        """
+        Forgets the quarantined rows without touching the quarantine file of an earlier run,
+        e.g. when a followed file is read again from the start.
+        """
+        if self.temp_file is not None:
+            self.temp_file.close()
+            os.remove(self.temp_file.name)
+            self.temp_file = None
+        self.rows = []
+
+    def report(self):
+        """
+        Prints how many rows of the file were quarantined and why.
+        """
+        if not self.count:
+            return
+        reasons = ", ".join(f"{column}: {count}" for column, count in self.reasons.items())
+        where = f", see {self.output_file()}" if self.directory is not None else ""
+        print(f"Warning: {self.count} malformed rows of '{self.file_name}' were skipped ({reasons}){where}.")
+
+def parse_csv_rows(lines, header=None, quarantine=None, first_line=1):
     """
-    Saves the processed outcomes to a text file (results.txt) and appends if the program loops.
+    Parses the lines of a survey CSV file straight into TrafficRecords, without a dictionary
+    per row like csv.DictReader would make. The categories
+    are interned (see InternedValues), the speeds are parsed once per distinct value.
+    Every field is validated while it is cleaned, which for a value seen before costs nothing
+    extra. Rows with a wrong number of fields, a speed that is not a whole number, a time
+    without an hour and so on go to the quarantine instead of stopping the file.
+
+    Parameters:
+    lines (iterable): Lines of the file, e.g. an open file.
+    header (list): Column names when lines has no header line (a chunk of a file).
+    quarantine (RowQuarantine): Where malformed rows go, None raises MalformedRowError for them.
+    first_line (int): Line number of the first line of lines in the file.
+
+    Yields:
+    TrafficRecord: One record per valid row, blank lines are skipped like DictReader does.
     """
-    with open(fileName, "a") as file: # Updating the reults everytime in the results.txt
-        file.write(f" \n")
-        file.write(f"Data file selected is {csv_file}")
-        file.write(f"\nThe total number of vehicles recorded for this date is {outcomes[0]}")
-        file.write(f"\nThe total number of trucks recorded for this date is {outcomes[1]}")
-        file.write(f"\nThe total number of electric vehicles for this date is {outcomes[2]}")
-        file.write(f"\nThe total number of two-wheeled vehicles for this date is {outcomes[3]}")
-        file.write(f"\nThe total number of Busses leaving Elm Avenue/Rabbit Road heading North is {outcomes[4]}")
-        file.write(f"\nThe total number of Vehicles through both junctions not turning left or right {outcomes[5]}")
-        file.write(f"\nThe percentage of total vehicles recorded that are trucks for this rate is{outcomes[9]}%")
-        file.write(f"\nThe average number of bikes per hour for this date is {outcomes[10]}")
-        file.write(f"\nThe total number of Vehicles recorded as over the speed limit for this date is {outcomes[6]}")
-        file.write(f"\nThe total number of Vehicles recorded through Elm Avenue/Rabbit Road junction is {outcomes[7]}")
-        file.write(f"\nThe total number of Vehicles recorded throug Hanley Highway/Westway is {outcomes[8]}")
-        file.write(f"\n{outcomes[11]}% of vehicles recorded through Elm Avenue/Rabbit Road are scooters")
-        file.write(f"\nThe highest number of vehicles in an hour on Hanley Highway/Westway is {outcomes[12]}")
-        file.write(f"\nThe most vehicles through Hanley Highway/Westway were recorded between {outcomes[13]}")
-        file.write(f"\nThe number of hours of rain for this date is {outcomes[14]}\n")
-        file.write(f" \n")
-        file.write("***********************************")
-        file.write(f" \n")
-
-
-def process_csv_data_with_histogram(file_name):
+    reader = csv.reader(lines)
+    if header is None:
+        header = next(reader, None)
+    vehicle_types = InternedValues(clean_required_category, "VehicleType")
+    electric_values = InternedValues(clean_electric, "elctricHybrid")
+    junctions = InternedValues(clean_junction, "JunctionName")
+    directions_in = InternedValues(clean_category, "travel_Direction_in")
+    directions_out = InternedValues(clean_category, "travel_Direction_out")
+    speeds = InternedValues(clean_whole_number, "VehicleSpeed")
+    speed_limits = InternedValues(clean_whole_number, "JunctionSpeedLimit")
+    hours = InternedValues(clean_hour, "timeOfDay")
+    weathers = InternedValues(clean_category, "Weather_Conditions")
+    make_record = TrafficRecord._make
+    positions = None
+    try:
+        for row in reader:
+            if not row:
+                continue
+            if positions is None: # Looked up at the first row, a missing column raises KeyError like DictReader rows do
+                positions = [header.index(column) if column in header else None for field, column in RECORD_COLUMNS]
+                for (field, column), position in zip(RECORD_COLUMNS, positions):
+                    if position is None:
+                        raise KeyError(column)
+                vehicle_type, electric, junction, direction_in, direction_out, speed, speed_limit, time_of_day, weather = positions
+                width = len(header)
+            try:
+                if len(row) != width:
+                    raise MalformedRowError("row", f"{len(row)} fields instead of {width}")
+                record = make_record((vehicle_types[row[vehicle_type]], electric_values[row[electric]], junctions[row[junction]],
+                                      directions_in[row[direction_in]], directions_out[row[direction_out]], speeds[row[speed]],
+                                      speed_limits[row[speed_limit]], hours[row[time_of_day].split(":")[0]], weathers[row[weather]]))
+            except MalformedRowError as e:
+                line = first_line - 1 + reader.line_num
+                if quarantine is None:
+                    raise MalformedRowError(e.column, f"line {line}: {e.reason}") from None
+                quarantine.add(line, e.column, e.reason, row)
+                continue
+            yield record
+    finally:
+        if quarantine is not None:
+            quarantine.lines_read = first_line - 1 + reader.line_num
+
+def read_csv_records(file_name, quarantine=None):
     """
-    Extended version of process_csv_data to include hourly traffic counts for histogram.
-    Returns hourly counts for Elm Avenue and Hanley Highway.
-    This is done using dictionary rather than list to acess the certain hour easily
+    Reads a survey CSV file lazily and yields one TrafficRecord at a time (see parse_csv_rows).
+    """
+    with open(file_name, 'r') as file:
+        yield from parse_csv_rows(file, quarantine=quarantine)
 
+class HourlyTopTracker:
     """
-    hourly_counts_elm = {} # Dictionary to store data
-    hourly_counts_hanley = {}
+    Counts the vehicles per hour for one junction and keeps track of the busiest
+    hour while counting, so the maximum never has to be searched for again.
+    """
+    def __init__(self):
+        """
+        Initializes an empty tracker.
+        """
+        self.counts = {} # hour -> count, in the order the hours first appear
+        self.busiest_count = 0
+        self.busiest_hours = set() # Hours whose count equals busiest_count
 
-    outcomes = process_csv_data(file_name)  # Reuse the existing logic
-    if outcomes:
-        # Extract hourly traffic counts
-        with open(file_name, 'r') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                hour = row["timeOfDay"].split(":")[0]  # Extract hour using split
-                junction = row["JunctionName"].strip()
-                if junction == "Elm Avenue/Rabbit Road":
-                    hourly_counts_elm[hour] = hourly_counts_elm.get(hour, 0) + 1
-                elif junction == "Hanley Highway/Westway":
-                    hourly_counts_hanley[hour] = hourly_counts_hanley.get(hour, 0) + 1
+    def add(self, hour, vehicles=1):
+        """
+        Counts vehicles (one by default) for the given hour. Runs in constant time.
+        """
+        count = self.counts.get(hour, 0) + vehicles
+        self.counts[hour] = count
+        if count > self.busiest_count: # A new maximum, only this hour has it
+            self.busiest_count = count
+            self.busiest_hours.clear()
+            self.busiest_hours.add(hour)
+        elif count == self.busiest_count: # Tied with the current maximum
+            self.busiest_hours.add(hour)
 
-    return outcomes, hourly_counts_elm, hourly_counts_hanley
+    def busiest(self):
+        """
+        Returns the busiest count and the hours that reached it, in the order they first appeared.
+        """
+        return self.busiest_count, [hour for hour in self.counts if hour in self.busiest_hours]
 
+    def top(self, k):
+        """
+        Returns the k busiest hours as (hour, count) pairs, highest count first.
+        Ties keep the order in which the hours first appeared.
+        """
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k] #https://docs.python.org/3/howto/sorting.html#sort-stability-and-complex-sorts
 
-# Task D
-import tkinter as tk
+def format_hour_range(hour):
+    """
+    Formats an hour such as "07" as "Between 07:00 and 8:00".
+    """
+    return f"Between {hour}:00 and {int(hour) + 1}:00"
 
-class HistogramApp:
+class HourlyHistogram:
     """
-    Creates a histogram to visualize hourly traffic data for both junctions.
+    Vehicles per hour of the day in 24 fixed slots of an array instead of a dictionary
+    such as {"07": 12}. It is read like the dictionaries it replaces: get("07", 0),
+    histogram["07"], keys(), values(), items() and dict(histogram) only show the hours with vehicles.
+    Hours outside 00-23 have no slot and are not counted (the histogram never showed them).
     """
-    def __init__(self, hourly_counts_elm, hourly_counts_hanley, date):
-        """ 
-        Initializes the app with traffic data and the date for the title.
+    __slots__ = ("slots",)
+
+    def __init__(self, counts=None):
         """
-        self.hourly_counts_elm = hourly_counts_elm
-        self.hourly_counts_hanley = hourly_counts_hanley
-        self.date = date
-        self.root = tk.Tk()
-        self.canvas = None  # Will hold the canvas for drawing
+        Initializes the histogram, optionally from a dictionary of hour -> count.
+        """
+        self.slots = array.array("q", bytes(8 * 24)) # 24 counts of 8 bytes
+        if counts:
+            for hour, count in counts.items():
+                self.add(hour, count)
 
-    def setup_window(self):
+    @staticmethod
+    def slot(hour):
         """
-        Sets up the Tkinter window and canvas for the histogram.
+        Returns the slot of an hour such as "07" or 7, None if it is not an hour of the day.
         """
-        self.root.title(f"Histogram")
-        self.root.geometry("1300x600")
-        self.canvas = tk.Canvas(self.root, width=1300, height=600, bg="white")
-        self.canvas.pack()
+        try:
+            slot = int(hour)
+        except (TypeError, ValueError):
+            return None
+        return slot if 0 <= slot < 24 else None
 
-    def draw_histogram(self):
+    def add(self, hour, vehicles=1):
         """
-        Draws the histogram with axes, labels, and bars.
+        Counts vehicles (one by default) for the given hour.
         """
-        bar_width = 20
-        gap = 30
-        max_height = 400
-        x_start = 50
-        y_start = 500
-
-        # Find the maximum hourly traffic count for scaling
-        max_count = max(max(self.hourly_counts_elm.values(), default=0),
-                        max(self.hourly_counts_hanley.values(), default=0))
-
-        # Axis labels
-        self.canvas.create_text(700, 550, text="Hours 00:00 to 24:00", font=("Arial", 12))
-
-        for i in range(24):
-            hour = f"{i:02d}"
-
-            # Elm Avenue bar
-            elm_count = self.hourly_counts_elm.get(hour, 0)
-            elm_height = (elm_count / max_count) * max_height if max_count > 0 else 0
-            self.canvas.create_rectangle(
-                x_start + (bar_width + gap) * i, y_start - elm_height,
-                x_start + bar_width + (bar_width + gap) * i, y_start,
-                fill="#96f997", outline="black"
-            )
+        slot = self.slot(hour)
+        if slot is not None:
+            self.slots[slot] += vehicles
 
-            # Display Elm Avenue value
-            self.canvas.create_text(
-            x_start + (bar_width + gap) * i + bar_width / 2, y_start - elm_height - 10,
-            text=str(elm_count), font=("Arial", 8), fill="#96f997"
-            )
+    def get(self, hour, default=0):
+        slot = self.slot(hour)
+        if slot is None or not self.slots[slot]:
+            return default
+        return self.slots[slot]
 
-            # Hanley Highway bar
-            hanley_count = self.hourly_counts_hanley.get(hour, 0)
-            hanley_height = (hanley_count / max_count) * max_height if max_count > 0 else 0
-            self.canvas.create_rectangle(
-                x_start + (bar_width + gap) * i + bar_width, y_start - hanley_height,
-                x_start + 2 * bar_width + (bar_width + gap) * i, y_start,
-                fill="#f89796", outline="black"
-            )
+    def __getitem__(self, hour):
+        count = self.get(hour, None)
+        if count is None:
+            raise KeyError(hour)
+        return count
 
-            # Display Hanley Highway value
-            self.canvas.create_text(
-            x_start + (bar_width + gap) * i + bar_width + bar_width / 2, y_start - hanley_height - 10,
-            text=str(hanley_count), font=("Arial", 8), fill="#f89796"
-            )
+    def __contains__(self, hour):
+        return self.get(hour, None) is not None
 
-            # Hour label
-            self.canvas.create_text(
-                x_start + (bar_width + gap) * i + bar_width, y_start + 15,
-                text=f"{hour}", font=("Arial", 8)
-            )
+    def keys(self):
+        return [f"{slot:02d}" for slot, count in enumerate(self.slots) if count]
 
-    def add_legend(self):
+    def values(self):
+        return [count for count in self.slots if count]
+
+    def items(self):
+        return [(f"{slot:02d}", count) for slot, count in enumerate(self.slots) if count]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for count in self.slots if count)
+
+    def clear(self):
+        for slot in range(24):
+            self.slots[slot] = 0
+
+    def __eq__(self, other):
+        if isinstance(other, HourlyHistogram):
+            return self.slots == other.slots
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"HourlyHistogram({dict(self.items())})"
+
+# Names of the 15 outcomes in the order used by display_outcomes,
+# also the columns of the machine readable results
+OUTCOME_NAMES = (
+    "total_vehicles", "trucks", "electric_vehicles", "two_wheeled_vehicles", "buses_elm_north",
+    "straight_through", "over_speed_limit", "elm_vehicles", "hanley_vehicles", "truck_percentage",
+    "average_bicycles_per_hour", "scooter_percentage", "hanley_peak_vehicles", "hanley_peak_hours", "rain_hours",
+)
+
+class TrafficOutcomes:
+    """
+    The 15 outcomes of a survey file as named attributes, e.g. outcomes.total_vehicles.
+    It has slots instead of a __dict__, and it can still be indexed, iterated and compared
+    like the list of outcomes it replaces.
+    """
+    __slots__ = OUTCOME_NAMES
+
+    def __init__(self, *values):
         """
-        Adds a legend to the histogram to indicate which bar corresponds to which junction.
+        Initializes the outcomes from the 15 values in the order of OUTCOME_NAMES.
         """
-        self.canvas.create_text(242, 30, text=f"Histogram of Vehicle Frequency per Hour ({self.date})", font=("Arial", 12))
-        self.canvas.create_rectangle(50, 50, 70, 70, fill="#96f997", outline="black")
-        self.canvas.create_text(90, 60, text="Elm Avenue/Rabbit Road", anchor="w", font=("Arial", 10))
-        self.canvas.create_rectangle(50, 80, 70, 100, fill="#f89796", outline="black")
-        self.canvas.create_text(90, 90, text="Hanley HighwayWestway", anchor="w", font=("Arial", 10))
+        if len(values) != len(OUTCOME_NAMES):
+            raise ValueError(f"Expected {len(OUTCOME_NAMES)} outcomes, got {len(values)}.")
+        for name, value in zip(OUTCOME_NAMES, values):
+            setattr(self, name, value)
 
-    def run(self):
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [getattr(self, name) for name in OUTCOME_NAMES[index]]
+        return getattr(self, OUTCOME_NAMES[index])
+
+    def __iter__(self):
+        return (getattr(self, name) for name in OUTCOME_NAMES)
+
+    def __len__(self):
+        return len(OUTCOME_NAMES)
+
+    def __eq__(self, other):
+        if isinstance(other, (TrafficOutcomes, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TrafficOutcomes({', '.join(f'{name}={getattr(self, name)!r}' for name in OUTCOME_NAMES)})"
+
+    def as_dict(self):
         """
-        Runs the Tkinter main loop to display the histogram.
+        Returns the outcomes as a dictionary of name -> value.
         """
-        self.setup_window()
-        self.draw_histogram()
-        self.add_legend()
-        self.root.mainloop()
+        return {name: getattr(self, name) for name in OUTCOME_NAMES}
 
-# Task E
-class MultiCSVProcessor:
-    def __init__(self):
+# Metric rule engine
+#
+# Metrics are declared as dictionaries instead of being written into the row loop:
+#   {"name": "buses_north", "kind": "count",
+#    "where": {"junction": "Elm Avenue/Rabbit Road", "direction_out": "n", "vehicle_type": "buss"}}
+# kind is "count" (number of matching rows), "hourly" (HourlyTopTracker of the matching rows)
+# or "running_share" (percentage of the rows counted by the metric named in "of", taken
+# at the last matching row, like the running percentages of the original loop).
+# "where" maps a field to a value or a list of allowed values, "group_by" splits a
+# count or hourly metric by the values of a field (e.g. one tracker per junction).
+
+# Python expression of every field a metric can use, on a normalised record
+RECORD_FIELDS = {"vehicle_type": "record[0]", "electric": "record[1]", "junction": "record[2]",
+                 "direction_in": "record[3]", "direction_out": "record[4]", "hour": "record[7]",
+                 "weather": "record[8]", "over_speed": "record[5] > record[6]",
+                 "no_turn": "record[3] == record[4]", "rain": "'rain' in record[8]"}
+
+# Cleaning applied to the values in a definition, the same as parse_csv_rows does to the rows
+FIELD_CLEANERS = {"vehicle_type": lambda value: value.strip().lower(), "junction": lambda value: value.strip(),
+                  "direction_in": lambda value: value.strip().lower(), "direction_out": lambda value: value.strip().lower(),
+                  "weather": lambda value: value.strip().lower(), "hour": lambda value: value}
+
+# The metrics behind the 15 outcomes of process_csv_data
+DEFAULT_METRICS = [
+    {"name": "total_vehicles", "kind": "count"},
+    {"name": "total_trucks", "kind": "count", "where": {"vehicle_type": "truck"}},
+    {"name": "electric_vehicles", "kind": "count", "where": {"electric": True}},
+    {"name": "two_wheeled_vehicles", "kind": "count", "where": {"vehicle_type": ["bicycle", "motorcycle", "scooter"]}},
+    {"name": "buses_north", "kind": "count", "where": {"junction": "Elm Avenue/Rabbit Road", "direction_out": "n", "vehicle_type": "buss"}},
+    {"name": "no_turn", "kind": "count", "where": {"no_turn": True}},
+    {"name": "over_speed", "kind": "count", "where": {"over_speed": True}},
+    {"name": "elm_junction", "kind": "count", "where": {"junction": "Elm Avenue/Rabbit Road"}},
+    {"name": "hanley_junction", "kind": "count", "where": {"junction": "Hanley Highway/Westway"}},
+    {"name": "total_bicycles", "kind": "count", "where": {"vehicle_type": "bicycle"}},
+    {"name": "truck_percentage", "kind": "running_share", "where": {"vehicle_type": "truck"}, "of": "total_vehicles"},
+    {"name": "scooter_percentage", "kind": "running_share", "where": {"junction": "Elm Avenue/Rabbit Road", "vehicle_type": "scooter"}, "of": "elm_junction"},
+    {"name": "vehicles_per_junction", "kind": "count", "group_by": "junction"},
+    {"name": "hourly_by_junction", "kind": "hourly", "group_by": "junction"},
+    {"name": "rain_hours", "kind": "hourly", "where": {"rain": True}},
+]
+
+# Per-row loop of MetricEngine, the two keys are filled in when the metrics are compiled
+EVALUATOR_SOURCE = """
+def evaluate(records, count_table, hourly_table, running, snapshots, add_key):
+    count_dispatch = count_table["dispatch"]
+    hourly_dispatch = hourly_table["dispatch"]
+    for record in records:
+        key = ({count_key})
+        entry = count_dispatch.get(key)
+        if entry is None:
+            entry = add_key(count_table, key)
+        entry[0] += 1
+        for index in entry[1]:
+            running[index] += 1
+        for index, source in entry[2]:
+            snapshots[index] = running[source]
+
+        key = ({hourly_key})
+        entry = hourly_dispatch.get(key)
+        if entry is None:
+            entry = add_key(hourly_table, key)
+        entry[0] += 1
+"""
+
+class MetricEngine:
+    """
+    Evaluates a list of metric definitions over normalised records.
+    The definitions are compiled once into dispatch tables and a generated row loop.
+    For every row the loop builds a key from only the fields the metrics use, and the
+    table remembers for each key which metrics it belongs to. A row therefore costs one key and one
+    lookup per table, and the counts are only added up per metric at the end. The cost of a row
+    does not depend on the number of metrics, but it grows with the number of fields they filter
+    or group on (each one is another value in the key) and with the number of different keys.
+    Hourly metrics have a table of their own so that the hour does not multiply the number of
+    keys of the other metrics.
+    """
+    def __init__(self, definitions=DEFAULT_METRICS):
         """
-        Initializes the application for processing multiple CSV files.
+        Compiles the metric definitions.
         """
-        self.outcomes = None  # Stores processed outcomes (e.g., averages or summaries).
-        self.hourly_counts_elm = {}  # Holds hourly traffic data for "Elm Avenue/Rabbit Road".
-        self.hourly_counts_hanley = {}  # Holds hourly traffic data for "Hanley Highway/Westway".
-        self.csv_file = None  # Stores the name of the currently loaded CSV file.
+        self.definitions = []
+        for definition in definitions:
+            if definition["kind"] not in ("count", "hourly", "running_share"):
+                raise ValueError(f"Unknown kind '{definition['kind']}' of metric '{definition['name']}'.")
+            where = {}
+            for field, allowed in definition.get("where", {}).items():
+                if field not in RECORD_FIELDS:
+                    raise ValueError(f"Unknown field '{field}' in metric '{definition['name']}'.")
+                if not isinstance(allowed, (list, tuple, set, frozenset)):
+                    allowed = [allowed]
+                if field not in FIELD_CLEANERS and not all(isinstance(value, bool) for value in allowed): # bool("false") is True
+                    raise ValueError(f"Field '{field}' in metric '{definition['name']}' only takes True or False.")
+                clean = FIELD_CLEANERS.get(field, bool)
+                where[field] = frozenset(clean(value) for value in allowed)
+            if definition.get("group_by") and definition["group_by"] not in RECORD_FIELDS:
+                raise ValueError(f"Unknown field '{definition['group_by']}' in metric '{definition['name']}'.")
+            self.definitions.append(dict(definition, where=where))
 
-    def load_csv_file(self, file_name, day, month, year):
+        # Running shares need the live count of the metric they refer to, those counts are kept per row
+        names = [definition["name"] for definition in self.definitions]
+        self.running_sources = {} # index of a counted metric -> position in self.running
+        self.share_sources = {} # index of a running share -> position of its "of" metric in self.running
+        for index, definition in enumerate(self.definitions):
+            if definition["kind"] == "running_share":
+                source = names.index(definition["of"]) if definition.get("of") in names else None
+                if source is None or self.definitions[source]["kind"] != "count" or self.definitions[source].get("group_by"):
+                    raise ValueError(f"Metric '{definition['name']}' must refer to an ungrouped count.")
+                self.share_sources[index] = self.running_sources.setdefault(source, len(self.running_sources))
+
+        namespace = {}
+        self.tables = [self.compile_table([index for index, definition in enumerate(self.definitions) if definition["kind"] != "hourly"], "count", namespace),
+                       self.compile_table([index for index, definition in enumerate(self.definitions) if definition["kind"] == "hourly"], "hourly", namespace)]
+        # Compiled once, e.g. key = (record[2], record[7], 'rain' in record[8], ) for the hourly table
+        exec(EVALUATOR_SOURCE.format(count_key=self.tables[0]["key_source"], hourly_key=self.tables[1]["key_source"]), namespace) #https://docs.python.org/3/library/functions.html#exec
+        self.evaluate = namespace["evaluate"]
+        self.reset()
+
+    def compile_table(self, indexes, table_name, namespace):
         """
-        Loads a CSV file, processes its data, and handles result display and visualization.
+        Builds the key expression of a dispatch table for the metrics with the given indexes.
+        Value sets used by the expression are added to namespace.
+        Fields that are only filtered on keep the values some metric asks for and map every
+        other value to None, which keeps the number of keys small.
         """
-        try:
-            # Process the file and extract necessary data
-            self.outcomes, self.hourly_counts_elm, self.hourly_counts_hanley = process_csv_data_with_histogram(file_name)
-            
-            if self.outcomes:  # Check if processing was successful
-                # Display outcomes
-                display_outcomes(self.outcomes, file_name)
-                
-                # Save results to a file
-                save_results_to_file(self.outcomes, fileName="results.txt", csv_file=file_name)
-                
-                # Show histogram
-                histogram_app = HistogramApp(
-                    self.hourly_counts_elm, self.hourly_counts_hanley, f"{day:02d}/{month:02d}/{year}"
-                )
-                histogram_app.run()
-                return True  # Indicate success
+        fields = [] # Fields that make up the key, in a fixed order
+        raw_fields = set() # Fields whose every value matters (grouping and the hour of hourly metrics)
+        for index in indexes:
+            definition = self.definitions[index]
+            used = list(definition["where"])
+            if definition.get("group_by"):
+                used.append(definition["group_by"])
+                raw_fields.add(definition["group_by"])
+            if definition["kind"] == "hourly":
+                used.append("hour")
+                raw_fields.add("hour")
+            for field in used:
+                if field not in fields:
+                    fields.append(field)
+
+        parts = []
+        for field in fields:
+            expression = RECORD_FIELDS[field]
+            if field in raw_fields or field not in FIELD_CLEANERS: # True/False fields are kept as they are
+                parts.append(expression)
             else:
-                print(f"Error: Failed to process data from file '{file_name}'.")
-                return False  # Indicate failure
-        except Exception as e:
-            print(f"An error occurred while processing file '{file_name}': {e}")
-            return False
+                values_name = f"{table_name}_values_{field}"
+                namespace[values_name] = frozenset().union(*(self.definitions[index]["where"].get(field, ()) for index in indexes))
+                parts.append(f"({expression} if {expression} in {values_name} else None)")
+        return {"metrics": tuple(indexes), "fields": tuple(fields), "positions": {field: position for position, field in enumerate(fields)},
+                "key_source": "".join(part + ", " for part in parts)}
 
-    def clear_previous_data(self):
+    def reset(self):
         """
-        Clears data from the previous run to process a new dataset.
+        Clears all counts, the compiled definitions are kept.
         """
-        self.outcomes = None
-        self.hourly_counts_elm.clear()
-        self.hourly_counts_hanley.clear()
-        self.csv_file = None  # Reset the file name
+        for table in self.tables:
+            table["dispatch"] = {} # key -> [rows with this key, running counts to increase, snapshots to take]
+            table["matches"] = {} # key -> indexes of the metrics the key belongs to
+        self.running = [0] * len(self.running_sources)
+        self.snapshots = [0] * len(self.definitions) # Running count at the last matching row
+        self.cached_results = None
 
-    def handle_user_interaction(self):
+    def add_key(self, table, key):
         """
-        Handles user interaction for input validation and processing.
+        Works out once which metrics a new key belongs to and adds it to the dispatch table.
         """
-        # Input validation for date
-        day, month, year = validate_day_month_year()
-        self.csv_file = f"traffic_data{day:02d}{month:02d}{year}.csv"  # Construct file name
+        values = dict(zip(table["fields"], key))
+        matches = tuple(index for index in table["metrics"]
+                        if all(values[field] in allowed for field, allowed in self.definitions[index]["where"].items()))
+        increments = tuple(self.running_sources[index] for index in matches if index in self.running_sources)
+        snapshots = tuple((index, self.share_sources[index]) for index in matches if index in self.share_sources)
+        table["matches"][key] = matches
+        entry = table["dispatch"][key] = [0, increments, snapshots]
+        return entry
 
-        # Load and process the file
-        if not self.load_csv_file(self.csv_file, day, month, year):
-            print(f"Error: Failed to process file '{self.csv_file}'. Please check if the file exists and is correctly formatted.")
+    def add_records(self, records):
+        """
+        Counts every record of an iterable. This is the per-row hot loop.
+        """
+        self.cached_results = None
+        self.evaluate(records, self.tables[0], self.tables[1], self.running, self.snapshots, self.add_key)
 
-    def process_files(self):
+    def add_record(self, record):
         """
-        Main loop for handling multiple CSV files until the user decides to quit.
+        Counts one record.
         """
-        print("Welcome to the Traffic Data Analysis Program!")
-        while True:
-            self.clear_previous_data()  # Clear previous data
-            self.handle_user_interaction()  # Handle current dataset
+        self.add_records((record,))
 
-            # Prompt to continue or exit
-            continue_choice = validate_continue_input()
-            if continue_choice == "N":
-                print("\nEnd of run. Goodbye!")
-                break
+    def row_count(self):
+        """
+        Returns the number of records counted so far, every record adds one to a single key of the count table.
+        """
+        return sum(entry[0] for entry in self.tables[0]["dispatch"].values())
+
+    def state(self):
+        """
+        Returns the counts as plain data that can be sent to another process and merged
+        into an engine with the same definitions (see merge_state).
+        """
+        return {"keys": [{key: entry[0] for key, entry in table["dispatch"].items()} for table in self.tables],
+                "running": list(self.running), "snapshots": list(self.snapshots)}
+
+    def merge_state(self, state):
+        """
+        Adds the counts of another engine with the same definitions, as if its records had
+        come after the records counted here. Keys new to this engine are added in the order they
+        first appeared there, so ties between hours are still reported in the order of the file.
+        Running shares are taken at the last matching row: if the other records have one,
+        its running count is moved on by the rows counted here.
+        """
+        self.cached_results = None
+        matched = set() # Running shares with a matching row in the other records
+        for table, keys in zip(self.tables, state["keys"]):
+            for key, rows in keys.items():
+                entry = table["dispatch"].get(key)
+                if entry is None:
+                    entry = self.add_key(table, key)
+                entry[0] += rows
+                matched.update(index for index, source in entry[2])
+        for index, source in self.share_sources.items():
+            if index in matched:
+                self.snapshots[index] = self.running[source] + state["snapshots"][index]
+        for position, rows in enumerate(state["running"]):
+            self.running[position] += rows
+
+    def results(self):
+        """
+        Adds up the counts of every key into the metrics.
+
+        Returns:
+        dict: Metric name -> int for counts and running shares, HourlyTopTracker for hourly metrics,
+              or a dict of group value -> result for grouped metrics.
+        """
+        if self.cached_results is not None:
+            return self.cached_results
+        totals = [0] * len(self.definitions)
+        groups = [{} for definition in self.definitions]
+        trackers = [HourlyTopTracker() for definition in self.definitions]
+        for table in self.tables:
+            positions = table["positions"]
+            for key, entry in table["dispatch"].items(): # Keys are in the order they first appeared
+                rows = entry[0]
+                for index in table["matches"][key]:
+                    definition = self.definitions[index]
+                    group_by = definition.get("group_by")
+                    if definition["kind"] == "hourly":
+                        if group_by:
+                            group = key[positions[group_by]]
+                            tracker = groups[index].get(group)
+                            if tracker is None:
+                                tracker = groups[index][group] = HourlyTopTracker()
+                        else:
+                            tracker = trackers[index]
+                        tracker.add(key[positions["hour"]], rows)
+                    elif group_by:
+                        group = key[positions[group_by]]
+                        groups[index][group] = groups[index].get(group, 0) + rows
+                    else:
+                        totals[index] += rows
+
+        results = {}
+        for index, definition in enumerate(self.definitions):
+            if definition.get("group_by"):
+                results[definition["name"]] = groups[index]
+            elif definition["kind"] == "hourly":
+                results[definition["name"]] = trackers[index]
+            elif definition["kind"] == "running_share":
+                # Percentage taken at the last matching row, 0 if nothing matched
+                results[definition["name"]] = round((totals[index] / self.snapshots[index]) * 100) if totals[index] else 0
+            else:
+                results[definition["name"]] = totals[index]
+        self.cached_results = results
+        return results
+
+class TrafficAccumulator:
+    """
+    Collects the traffic metrics and the hourly counts of both junctions in a single
+    pass over the records, so a file only has to be read and parsed once.
+    The metrics are evaluated by a MetricEngine, by default with DEFAULT_METRICS.
+    Other consumers can register extra per-row aggregations that run in the same pass.
+    """
+    def __init__(self, metrics=DEFAULT_METRICS):
+        """
+        Initializes all counters to zero.
+        metrics can list extra metric definitions, they must include DEFAULT_METRICS for outcomes().
+        """
+        self.engine = MetricEngine(metrics)
+        self.quarantine = None # Malformed rows of the last processed file
+        self.aggregations = {} # Extra aggregations: name -> update function
+        self.aggregation_results = {} # Current value of every extra aggregation
+
+    def register_aggregation(self, name, update, initial=0):
+        """
+        Registers an extra aggregation that is updated for every record of the pass.
+
+        Parameters:
+        name (str): Name used to read the result from aggregation_results.
+        update (function): Called as update(value, record) and returns the new value.
+                           The record is a TrafficRecord (see parse_csv_rows).
+        initial: Starting value of the aggregation (copied, so a list or dict can be reused).
+        """
+        self.aggregations[name] = update
+        self.aggregation_results[name] = copy.copy(initial)
+
+    def add_record(self, record):
+        """
+        Updates the metrics with one normalised record.
+        """
+        self.add_records((record,))
+
+    def add_records(self, records):
+        """
+        Updates the metrics with every record of an iterable.
+        """
+        if not self.aggregations:
+            self.engine.add_records(records)
+            return
+        for record in records:
+            self.engine.add_record(record)
+            # Extra aggregations registered by other consumers
+            for name, update in self.aggregations.items():
+                self.aggregation_results[name] = update(self.aggregation_results[name], record)
+
+    def process_file(self, file_name, stats=None, quarantine=None):
+        """
+        Streams a survey file (CSV or columnar .tdc) through the accumulator.
+        Malformed rows are skipped and saved in the quarantine, which is kept in self.quarantine.
+
+        Parameters:
+        file_name (str): Name of the file to process.
+        stats (PipelineStats): Optional statistics that time the open, parse and evaluate stages.
+        quarantine (RowQuarantine): Where malformed rows go, by default quarantine/<file name>.csv (only in memory for a .tdc file).
+
+        Returns:
+        bool: True if the file was processed, False if it is missing or has no valid rows.
+        """
+        if stats is None:
+            stats = NO_STATS
+        if quarantine is None:
+            # A .tdc file has no malformed rows, and its quarantine would replace the one of the CSV file of the same day
+            quarantine = RowQuarantine(file_name, directory=None if is_columnar_file(file_name) else QUARANTINE_DIR)
+        self.quarantine = quarantine
+        try:
+            with stats.stage("open"):
+                records = read_records(file_name, quarantine)
+                # Check if the file is empty or not formatted properly (only the first row is read)
+                first_record = next(records, None)
+            if first_record is None:
+                print(f"Error: The file '{file_name}' is empty or not formatted properly.")
+                return False
+
+            with stats.stage("evaluate"):
+                self.add_record(first_record)
+                self.add_records(stats.counted_records(records))
+            if stats.current is not None:
+                stats.current["rows"] += 1 # The first record
+            return True
+
+        # Output when the there is no such file is found
+        except FileNotFoundError:
+            print(f"Error: File '{file_name}' not found.")
+            return False
+        finally:
+            quarantine.close()
+            quarantine.report()
+            if stats.current is not None:
+                stats.current["malformed_rows"] = quarantine.count
+
+    def metric_results(self):
+        """
+        Returns the results of every metric definition by name (see MetricEngine.results).
+        """
+        return self.engine.results()
+
+    def hourly_counts(self, junction):
+        """
+        Returns the hourly counts of a junction as an HourlyHistogram, e.g. {"07": 12, "08": 30}.
+        """
+        tracker = self.engine.results()["hourly_by_junction"].get(junction)
+        if tracker is None:
+            return HourlyHistogram()
+        return HourlyHistogram(tracker.counts)
+
+    @property
+    def hourly_counts_elm(self):
+        """
+        Hourly traffic count for Elm Avenue/Rabbit Road.
+        """
+        return self.hourly_counts("Elm Avenue/Rabbit Road")
+
+    @property
+    def hourly_counts_hanley(self):
+        """
+        Hourly traffic count for Hanley Highway/Westway.
+        """
+        return self.hourly_counts("Hanley Highway/Westway")
+
+    def top_hours(self, junction, k=1):
+        """
+        Returns the k busiest hours of a junction as (hour, count) pairs, highest count first.
+        An unknown junction gives an empty list.
+        """
+        tracker = self.engine.results()["hourly_by_junction"].get(junction)
+        if tracker is None:
+            return []
+        return tracker.top(k)
+
+    def outcomes(self):
+        """
+        Returns the 15 computed metrics as TrafficOutcomes.
+        """
+        results = self.engine.results()
+        # Busiest hour specifically for Hanley Highway/Westway, ties are all reported
+        busiest_hour, busiest_hours = results["hourly_by_junction"].get("Hanley Highway/Westway", HourlyTopTracker()).busiest()
+        busiest_hour_times = [format_hour_range(hour) for hour in busiest_hours]
+        # Equation to find the average bicycle per hour
+        average_bicycles_per_hour = round(results["total_bicycles"] / 24)
+        return TrafficOutcomes(results["total_vehicles"], results["total_trucks"], results["electric_vehicles"], results["two_wheeled_vehicles"],
+                               results["buses_north"], results["no_turn"], results["over_speed"], results["elm_junction"], results["hanley_junction"],
+                               results["truck_percentage"], average_bicycles_per_hour, results["scooter_percentage"],
+                               busiest_hour, ",".join(busiest_hour_times), len(results["rain_hours"].counts))
+
+def read_records(file_name, quarantine=None):
+    """
+    Returns a generator of normalised records for a survey file.
+    Columnar .tdc files (see convert_csv_to_columnar) are read through mmap,
+    every other file is read as CSV, with its malformed rows going to quarantine
+    (a .tdc file only holds rows that were valid when it was converted).
+    """
+    if is_columnar_file(file_name):
+        return read_columnar_records(file_name)
+    return read_csv_records(file_name, quarantine)
+
+def process_csv_data(file_name, backend="python"):
+    """
+    Processes traffic data from a CSV file to compute various metrics, such as:
+    Total number of vehicles, trucks, electric vehicles, and two-wheeled vehicles.
+    Buses traveling north at a specific junction.
+    Vehicles that didn't turn and those exceeding the speed limit.
+    Junction-specific vehicle counts and hourly traffic patterns.
+    Hours with rain and busiest traffic hour.
+    The file is streamed row by row through a TrafficAccumulator
+    so it is never loaded into memory as a whole.
+    
+    Parameters:
+    file_name (str): Name of the CSV file to process.
+    backend (str): "python" (reference implementation), "numpy" (columnar backend)
+                   or "parallel" (chunks of the file on several processes).
+
+    Returns:
+    TrafficOutcomes: Computed metrics or None if the file is not found.
+    """
+    if backend == "numpy":
+        return process_csv_data_columnar(file_name)[0]
+    if backend == "parallel":
+        return process_csv_data_chunked(file_name)[0]
+
+    accumulator = TrafficAccumulator()
+    if accumulator.process_file(file_name):
+        return accumulator.outcomes()
+    return None
+
+def display_outcomes(outcomes, file_name):
+    """
+    Displays the calculated outcomes in a clear and formatted way.
+    """
+    if not isinstance(outcomes, TrafficOutcomes): # A plain list of the 15 values
+        outcomes = TrafficOutcomes(*outcomes)
+    print(f"\n***************************")
+    print(f"Data file selected is {file_name}")
+    print(f"***************************")
+    print(f"The total number of vehicles recorded for this date is {outcomes.total_vehicles}")
+    print(f"The total number of trucks recorded for this date is {outcomes.trucks}")
+    print(f"The total number of electric vehicles for this date is {outcomes.electric_vehicles}")
+    print(f"The total number of two-wheeled vehicles for this date is {outcomes.two_wheeled_vehicles}")
+    print(f"The total number of Busses leaving Elm Avenue/Rabbit Road heading North is {outcomes.buses_elm_north}")
+    print(f"The total number of Vehicles through both junctions not turning left or right is {outcomes.straight_through}")
+    print(f"The percentage of total vehicles recorded that are trucks for this date is {outcomes.truck_percentage}%")
+    print(f"the average number of Bikes per hour for this date is {outcomes.average_bicycles_per_hour}")
+    print(f"The total number of Vehicles recorded as over the speed limit for this date is {outcomes.over_speed_limit}")
+    print(f"The total number of vehicles recorded through Elm Avenue/Rabbit Road junction is {outcomes.elm_vehicles}")
+    print(f"The total number of vehicles recorded through Hanley Highway/Westway junction is {outcomes.hanley_vehicles}")
+    print(f"{outcomes.scooter_percentage}% of vehicles recorded through Elm Avenue/Rabbit Road are scooters.")
+    print(f"The highest number of vehicles in an hour on Hanley Highway/Westway is {outcomes.hanley_peak_vehicles}")
+    print(f"The most vehicles through Hanley Highway/Westway were recorded between {outcomes.hanley_peak_hours}")
+    print(f"The number of hours of rain for this date is {outcomes.rain_hours}")
+
+
+# Task C: Save Results to Text File
+
+RESULT_FORMATS = ("text", "csv", "jsonl", "columns")
+RESULT_EXTENSIONS = {"csv": ".csv", "jsonl": ".jsonl", "columns": ".columns.json"}
+
+def results_text(outcomes, csv_file):
+    """
+    Returns the text report of one file, as it has always been saved in results.txt.
+    """
+    if not isinstance(outcomes, TrafficOutcomes): # A plain list of the 15 values
+        outcomes = TrafficOutcomes(*outcomes)
+    return (f" \n"
+            f"Data file selected is {csv_file}"
+            f"\nThe total number of vehicles recorded for this date is {outcomes.total_vehicles}"
+            f"\nThe total number of trucks recorded for this date is {outcomes.trucks}"
+            f"\nThe total number of electric vehicles for this date is {outcomes.electric_vehicles}"
+            f"\nThe total number of two-wheeled vehicles for this date is {outcomes.two_wheeled_vehicles}"
+            f"\nThe total number of Busses leaving Elm Avenue/Rabbit Road heading North is {outcomes.buses_elm_north}"
+            f"\nThe total number of Vehicles through both junctions not turning left or right {outcomes.straight_through}"
+            f"\nThe percentage of total vehicles recorded that are trucks for this rate is{outcomes.truck_percentage}%"
+            f"\nThe average number of bikes per hour for this date is {outcomes.average_bicycles_per_hour}"
+            f"\nThe total number of Vehicles recorded as over the speed limit for this date is {outcomes.over_speed_limit}"
+            f"\nThe total number of Vehicles recorded through Elm Avenue/Rabbit Road junction is {outcomes.elm_vehicles}"
+            f"\nThe total number of Vehicles recorded throug Hanley Highway/Westway is {outcomes.hanley_vehicles}"
+            f"\n{outcomes.scooter_percentage}% of vehicles recorded through Elm Avenue/Rabbit Road are scooters"
+            f"\nThe highest number of vehicles in an hour on Hanley Highway/Westway is {outcomes.hanley_peak_vehicles}"
+            f"\nThe most vehicles through Hanley Highway/Westway were recorded between {outcomes.hanley_peak_hours}"
+            f"\nThe number of hours of rain for this date is {outcomes.rain_hours}\n"
+            f" \n"
+            "***********************************"
+            f" \n")
+
+class ResultsWriter:
+    """
+    Collects the outcomes of survey files and saves them in one go, in one or more formats:
+    "text" (the report in results.txt), "csv", "jsonl" (one JSON object per line) and "columns"
+    (a JSON object with one list per outcome). Every row of the machine readable formats is
+    keyed by the survey date and the file name.
+    The new results are added to a copy of the old file that then replaces it, with a lock
+    around it, so the file is never half written and runs at the same time never mix their lines.
+    """
+    def __init__(self, results_file="results.txt", formats=("text",)):
+        """
+        Initializes the writer, the other formats are saved next to the text report,
+        e.g. results.csv or results.jsonl.
+        """
+        for result_format in formats:
+            if result_format not in RESULT_FORMATS:
+                raise ValueError(f"Unknown results format '{result_format}', use one of {', '.join(RESULT_FORMATS)}")
+        self.results_file = results_file
+        self.formats = tuple(formats)
+        self.pending = [] # (csv_file, outcomes) not saved yet
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def output_file(self, result_format):
+        """
+        Returns the file a format is saved in.
+        """
+        if result_format == "text":
+            return self.results_file
+        return os.path.splitext(self.results_file)[0] + RESULT_EXTENSIONS[result_format]
+
+    def add(self, outcomes, csv_file):
+        """
+        Adds the outcomes of a file, they are saved by the next flush().
+        """
+        self.pending.append((csv_file, list(outcomes)))
+
+    def rows(self):
+        """
+        Returns the pending results as dictionaries keyed by date and file.
+        """
+        rows = []
+        for csv_file, outcomes in self.pending:
+            survey_date = date_from_file_name(csv_file) if csv_file else None
+            row = {"date": survey_date.isoformat() if survey_date else None, "file": csv_file}
+            row.update(zip(OUTCOME_NAMES, outcomes))
+            rows.append(row)
+        return rows
+
+    def flush(self):
+        """
+        Saves the pending results in every format.
+        """
+        if not self.pending:
+            return
+        rows = self.rows()
+        for result_format in self.formats:
+            output_file = self.output_file(result_format)
+            if result_format == "columns":
+                self.replace_file(output_file, lambda old_file, new_file: self.merge_columns(old_file, new_file, rows))
+            elif result_format == "csv":
+                self.replace_file(output_file, lambda old_file, new_file: self.append_csv(old_file, new_file, rows))
+            else:
+                if result_format == "text":
+                    text = "".join(results_text(outcomes, csv_file) for csv_file, outcomes in self.pending)
+                else:
+                    text = "".join(json.dumps(row) + "\n" for row in rows)
+                self.replace_file(output_file, lambda old_file, new_file: self.append_text(old_file, new_file, text))
+        self.pending = []
+
+    @staticmethod
+    def append_text(old_file, new_file, text):
+        """
+        Copies the old results and adds the new text after them.
+        """
+        if old_file is not None:
+            shutil.copyfileobj(old_file, new_file)
+        new_file.write(text)
+
+    @staticmethod
+    def append_csv(old_file, new_file, rows):
+        """
+        Copies the old CSV results and adds the rows after them, with the header if the old file is missing or empty.
+        The header is decided here, while the lock is held, so two runs can't both write it.
+        """
+        writer = csv.DictWriter(new_file, fieldnames=["date", "file"] + list(OUTCOME_NAMES), lineterminator="\n")
+        if old_file is None or not old_file.read(1):
+            writer.writeheader()
+        else:
+            old_file.seek(0)
+            shutil.copyfileobj(old_file, new_file)
+        writer.writerows(rows)
+
+    @staticmethod
+    def merge_columns(old_file, new_file, rows):
+        """
+        Adds the rows to the lists of the old columnar results.
+        """
+        columns = json.load(old_file) if old_file is not None else {}
+        for name in ["date", "file"] + list(OUTCOME_NAMES):
+            columns.setdefault(name, []).extend(row[name] for row in rows)
+        json.dump(columns, new_file)
+
+    @staticmethod
+    def replace_file(file_name, write):
+        """
+        Writes the new version of a results file to a temporary file and renames it over the old one.
+        The lock file stops another run from replacing it at the same time and losing these results.
+        """
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_name + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX) # Released when the lock file is closed
+            temp_file = f"{file_name}.{os.getpid()}.tmp"
+            try:
+                with open(temp_file, "w", newline="") as new_file:
+                    if os.path.exists(file_name):
+                        with open(file_name, newline="") as old_file:
+                            write(old_file, new_file)
+                    else:
+                        write(None, new_file)
+                os.replace(temp_file, file_name)
+            except BaseException:
+                if os.path.exists(temp_file): # The old results stay as they were
+                    os.remove(temp_file)
+                raise
+
+def save_results_to_file(outcomes, fileName="results.txt", csv_file=None, formats=("text",)):
+    """
+    Saves the processed outcomes to a text file (results.txt) and appends if the program loops.
+    formats can add machine readable copies of the results, see ResultsWriter.
+    """
+    with ResultsWriter(fileName, formats) as writer: # Updating the reults everytime in the results.txt
+        writer.add(outcomes, csv_file)
+
+
+def process_csv_data_with_histogram(file_name, backend="python", stats=None):
+    """
+    Extended version of process_csv_data to include hourly traffic counts for histogram.
+    Returns hourly counts for Elm Avenue and Hanley Highway.
+    This is done using dictionary rather than list to acess the certain hour easily.
+    The outcomes and both histograms are collected in the same pass over the file.
+    backend can be "python" (reference implementation), "numpy" (columnar backend)
+    or "parallel" (chunks of the file on several processes).
+    stats is an optional PipelineStats that times the stages.
+
+    """
+    if backend == "numpy":
+        with (stats or NO_STATS).stage("process"):
+            return process_csv_data_columnar(file_name, stats)
+    if backend == "parallel":
+        with (stats or NO_STATS).stage("process"):
+            return process_csv_data_chunked(file_name)
+
+    accumulator = TrafficAccumulator()
+    if not accumulator.process_file(file_name, stats):
+        return None, {}, {}
+
+    return accumulator.outcomes(), accumulator.hourly_counts_elm, accumulator.hourly_counts_hanley
+
+
+# Chunked processing of one large file
+CHUNK_MIN_BYTES = 4 * 1024 * 1024 # Smaller chunks are not worth starting a process for
+
+def csv_chunk_ranges(file_name, chunks, min_bytes=CHUNK_MIN_BYTES):
+    """
+    Splits the rows of a CSV file into byte ranges that start and end on line boundaries.
+    Survey files have no line breaks inside fields, so every range holds whole rows.
+
+    Parameters:
+    file_name (str): CSV file to split.
+    chunks (int): Largest number of ranges.
+    min_bytes (int): Smallest size of a range, a small file gives fewer ranges.
+
+    Returns:
+    tuple: (header columns, list of (start, end) byte positions in file order).
+    """
+    size = os.path.getsize(file_name)
+    with open(file_name, 'rb') as file:
+        header_line = file.readline()
+        start = file.tell()
+        chunks = max(1, min(chunks, (size - start) // max(1, min_bytes)))
+        boundaries = [start]
+        for number in range(1, chunks):
+            position = start + (size - start) * number // chunks
+            file.seek(position - 1)
+            file.readline() # Move on to the start of the next line
+            if boundaries[-1] < file.tell() < size:
+                boundaries.append(file.tell())
+        boundaries.append(size)
+    header = next(csv.reader([header_line.decode(locale.getpreferredencoding(False))]), [])
+    return header, [(boundaries[number], boundaries[number + 1]) for number in range(len(boundaries) - 1)
+                    if boundaries[number] < boundaries[number + 1]]
+
+def read_byte_range_lines(file_name, start, end, block_size=8 * 1024 * 1024):
+    """
+    Yields the lines of a file between two byte positions on line boundaries,
+    reading blocks of block_size bytes so a chunk is never loaded as a whole.
+    """
+    encoding = locale.getpreferredencoding(False) # The encoding open() uses in read_csv_records
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        remaining = end - start
+        rest = b""
+        while remaining > 0:
+            block = file.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            block = rest + block
+            cut = len(block) if remaining <= 0 else block.rfind(b"\n") + 1 # Keep a cut line for the next block
+            rest = block[cut:]
+            yield from io.StringIO(block[:cut].decode(encoding)) #https://docs.python.org/3/library/io.html#io.StringIO
+        if rest:
+            yield rest.decode(encoding)
+
+def process_csv_chunk(file_name, header, start, end, quarantine_dir):
+    """
+    Worker used by process_csv_data_chunked: counts the rows of one byte range in a pool process.
+    The malformed rows are saved in a quarantine file of the range in quarantine_dir, so a badly
+    damaged range is not kept in memory or sent back to the parent process as a whole.
+
+    Returns:
+    tuple: (partial state of a MetricEngine (see MetricEngine.state), quarantine file of the range
+           with line numbers counted from the start of the range or None if it has no malformed rows,
+           number of lines in the range)
+    """
+    engine = MetricEngine()
+    quarantine = RowQuarantine(file_name, quarantine_dir, name=f"{start}.csv")
+    engine.add_records(parse_csv_rows(read_byte_range_lines(file_name, start, end), header, quarantine))
+    quarantine.close()
+    return engine.state(), quarantine.output_file() if quarantine.count else None, quarantine.lines_read
+
+def process_csv_data_chunked(file_name, workers=None, chunks=None, min_bytes=CHUNK_MIN_BYTES):
+    """
+    Processes one large CSV file on several processes. The file is split into byte ranges
+    (csv_chunk_ranges), each range is counted into a partial state in its own process and the
+    states are merged in file order, so the outcomes are the same as those of a single pass,
+    including the running percentages. Columnar .tdc files are processed in one pass.
+
+    Parameters:
+    file_name (str): CSV file to process.
+    workers (int): Number of processes, None uses one per CPU.
+    chunks (int): Number of ranges, by default one per process.
+    min_bytes (int): Smallest size of a range.
+
+    Returns:
+    tuple: (outcomes, hourly_counts_elm, hourly_counts_hanley), (None, {}, {}) on failure.
+    """
+    accumulator = TrafficAccumulator()
+    if is_columnar_file(file_name):
+        if not accumulator.process_file(file_name):
+            return None, {}, {}
+        return accumulator.outcomes(), accumulator.hourly_counts_elm, accumulator.hourly_counts_hanley
+
+    try:
+        header, ranges = csv_chunk_ranges(file_name, chunks or workers or os.cpu_count() or 1, min_bytes)
+    except FileNotFoundError:
+        print(f"Error: File '{file_name}' not found.")
+        return None, {}, {}
+
+    quarantine = RowQuarantine(file_name)
+    with tempfile.TemporaryDirectory() as quarantine_dir: # Quarantine files of the ranges
+        if len(ranges) <= 1: # Not worth a pool
+            chunk_results = [process_csv_chunk(file_name, header, start, end, quarantine_dir) for start, end in ranges]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor: #https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+                chunk_results = list(executor.map(process_csv_chunk, itertools.repeat(file_name), itertools.repeat(header),
+                                                  [start for start, end in ranges], [end for start, end in ranges],
+                                                  itertools.repeat(quarantine_dir)))
+        lines_before = 1 # The header
+        for state, chunk_quarantine_file, lines in chunk_results: # In file order
+            accumulator.engine.merge_state(state)
+            if chunk_quarantine_file is not None:
+                quarantine.add_file(chunk_quarantine_file, lines_before)
+            lines_before += lines
+    quarantine.close()
+    quarantine.report()
+
+    if accumulator.engine.results()["total_vehicles"] == 0:
+        print(f"Error: The file '{file_name}' is empty or not formatted properly.")
+        return None, {}, {}
+    return accumulator.outcomes(), accumulator.hourly_counts_elm, accumulator.hourly_counts_hanley
+
+
+# Columnar backend (optional, needs NumPy)
+
+# Columns that are stored as categoricals (code per row + list of distinct values)
+CATEGORICAL_COLUMNS = ("VehicleType", "elctricHybrid", "JunctionName", "travel_Direction_in",
+                       "travel_Direction_out", "Weather_Conditions", "timeOfDay")
+
+def load_csv_columns(file_name, block_size=500000):
+    """
+    Loads a traffic CSV file into typed NumPy column arrays.
+    Text columns become categoricals: an integer code per row and the list of distinct values,
+    so every distinct value is only cleaned once instead of once per row.
+    The file is read in blocks of block_size rows to keep the text data small.
+
+    Parameters:
+    file_name (str): Name of the CSV file to load.
+    block_size (int): Number of rows converted at a time.
+
+    Returns:
+    dict: Column name -> (codes, categories) for categorical columns and
+          column name -> integer array for VehicleSpeed and JunctionSpeedLimit.
+          None if the file has no records.
+    """
+    if np is None:
+        raise ImportError("The numpy backend needs NumPy to be installed.")
+
+    with open(file_name, 'r') as file:
+        csv_reader = csv.reader(file)
+        header = next(csv_reader, None)
+        block = [row for row in itertools.islice(csv_reader, block_size) if row] # Blank lines are skipped like DictReader does
+        if not block: # Check if the file is empty or has no records
+            return None
+        for name in CATEGORICAL_COLUMNS + ("VehicleSpeed", "JunctionSpeedLimit"):
+            if name not in header: # A missing column raises KeyError like the Python backend
+                raise KeyError(name)
+        positions = {name: header.index(name) for name in CATEGORICAL_COLUMNS + ("VehicleSpeed", "JunctionSpeedLimit")}
+
+        lookups = {name: {} for name in CATEGORICAL_COLUMNS} # value -> code, shared by all blocks
+        code_blocks = {name: [] for name in CATEGORICAL_COLUMNS}
+        speed_blocks = {"VehicleSpeed": [], "JunctionSpeedLimit": []}
+        while block:
+            if any(len(row) != len(header) for row in block):
+                raise ValueError(f"The file '{file_name}' has a row with missing or extra fields.")
+            columns = list(zip(*block)) # Turn the rows into columns
+            for name in CATEGORICAL_COLUMNS:
+                values, inverse = np.unique(np.array(columns[positions[name]]), return_inverse=True)
+                lookup = lookups[name]
+                block_codes = np.array([lookup.setdefault(value, len(lookup)) for value in values.tolist()], dtype=np.int32)
+                code_blocks[name].append(block_codes[inverse.ravel()])
+            for name in speed_blocks:
+                column = columns[positions[name]]
+                speed_blocks[name].append(np.fromiter(map(int, column), dtype=np.int64, count=len(column)))
+            block = [row for row in itertools.islice(csv_reader, block_size) if row]
+
+    data = {}
+    for name in CATEGORICAL_COLUMNS:
+        data[name] = (np.concatenate(code_blocks[name]), list(lookups[name]))
+    for name, blocks in speed_blocks.items():
+        data[name] = np.concatenate(blocks)
+    return data
+
+def normalise_categories(column, clean):
+    """
+    Cleans the distinct values of a categorical column and gives the cleaned values new codes.
+
+    Parameters:
+    column (tuple): (codes, categories) as returned by load_csv_columns.
+    clean (function): Cleaning applied to each distinct value, e.g. strip and lower case.
+
+    Returns:
+    tuple: (codes, categories) of the cleaned values.
+    """
+    codes, categories = column
+    lookup = {}
+    remap = np.array([lookup.setdefault(clean(value), len(lookup)) for value in categories], dtype=np.int32)
+    return remap[codes], list(lookup)
+
+def category_code(categories, value):
+    """
+    Returns the code of a value in a category list, or -1 when the value never occurs.
+    """
+    return categories.index(value) if value in categories else -1
+
+def hourly_histogram(hour_codes, hours, mask):
+    """
+    Counts the rows selected by mask per hour with np.bincount.
+    The dictionary keeps the order in which the hours first appear, like the Python backend.
+    """
+    selected = hour_codes[mask]
+    counts = np.bincount(selected, minlength=len(hours))
+    present, first_index = np.unique(selected, return_index=True)
+    return {hours[code]: int(counts[code]) for code in present[np.argsort(first_index)].tolist()}
+
+def compute_outcomes_columnar(data):
+    """
+    Computes the 15 outcomes and both hourly histograms from column arrays with vectorized masks.
+
+    Parameters:
+    data (dict): Columns returned by load_csv_columns.
+
+    Returns:
+    tuple: (outcomes, hourly_counts_elm, hourly_counts_hanley)
+    """
+    vehicle, vehicle_types = normalise_categories(data["VehicleType"], lambda value: value.strip().lower())
+    electric_codes, electric_values = normalise_categories(data["elctricHybrid"], lambda value: value.strip().lower() == "true")
+    junction, junctions = normalise_categories(data["JunctionName"], lambda value: value.strip())
+    rain_codes, rain_values = normalise_categories(data["Weather_Conditions"], lambda value: "rain" in value.strip().lower())
+    hour, hours = normalise_categories(data["timeOfDay"], lambda value: value.split(":")[0])
+
+    # Both direction columns share one category list so that their codes can be compared
+    direction_in_codes, direction_in_values = data["travel_Direction_in"]
+    direction_out_codes, direction_out_values = data["travel_Direction_out"]
+    offset = len(direction_in_values)
+    direction, directions = normalise_categories(
+        (np.concatenate([direction_in_codes, direction_out_codes + offset]), direction_in_values + direction_out_values),
+        lambda value: value.strip().lower())
+    direction_in, direction_out = direction[:len(direction_in_codes)], direction[len(direction_in_codes):]
+
+    total_vehicles = len(vehicle)
+    is_truck = vehicle == category_code(vehicle_types, "truck")
+    is_bicycle = vehicle == category_code(vehicle_types, "bicycle")
+    is_scooter = vehicle == category_code(vehicle_types, "scooter")
+    is_two_wheeled = is_bicycle | is_scooter | (vehicle == category_code(vehicle_types, "motorcycle"))
+    is_elm = junction == category_code(junctions, "Elm Avenue/Rabbit Road")
+    is_hanley = junction == category_code(junctions, "Hanley Highway/Westway")
+    is_electric = np.array(electric_values, dtype=bool)[electric_codes]
+    is_rain = np.array(rain_values, dtype=bool)[rain_codes]
+
+    total_trucks = int(np.count_nonzero(is_truck))
+    total_bicycles = int(np.count_nonzero(is_bicycle))
+    elm_scooters = is_elm & is_scooter
+    scooter_count = int(np.count_nonzero(elm_scooters))
+    buses_north = int(np.count_nonzero(is_elm & (direction_out == category_code(directions, "n")) & (vehicle == category_code(vehicle_types, "buss"))))
+
+    # The percentages are the running values of the row loop, i.e. taken at the last truck/scooter
+    truck_percentage = 0
+    if total_trucks:
+        last_truck = int(np.flatnonzero(is_truck)[-1])
+        truck_percentage = round((total_trucks / (last_truck + 1)) * 100)
+    scooter_percentage = 0
+    if scooter_count:
+        last_scooter = int(np.flatnonzero(elm_scooters)[-1])
+        scooter_percentage = round((scooter_count / int(np.count_nonzero(is_elm[:last_scooter + 1]))) * 100)
+    average_bicycles_per_hour = round(total_bicycles / 24) if total_bicycles > 0 else 0
+
+    hourly_counts_elm = hourly_histogram(hour, hours, is_elm)
+    hourly_counts_hanley = hourly_histogram(hour, hours, is_hanley)
+    busiest_hour = max(hourly_counts_hanley.values(), default=0)
+    busiest_hour_times = [format_hour_range(hour_label) for hour_label, count in hourly_counts_hanley.items() if count == busiest_hour]
+
+    outcomes = TrafficOutcomes(total_vehicles, total_trucks, int(np.count_nonzero(is_electric)), int(np.count_nonzero(is_two_wheeled)),
+                               buses_north, int(np.count_nonzero(direction_in == direction_out)),
+                               int(np.count_nonzero(data["VehicleSpeed"] > data["JunctionSpeedLimit"])),
+                               int(np.count_nonzero(is_elm)), int(np.count_nonzero(is_hanley)),
+                               truck_percentage, average_bicycles_per_hour, scooter_percentage,
+                               busiest_hour, ",".join(busiest_hour_times), len(np.unique(hour[is_rain])))
+    return outcomes, HourlyHistogram(hourly_counts_elm), HourlyHistogram(hourly_counts_hanley)
+
+def process_csv_data_columnar(file_name, stats=None):
+    """
+    Columnar version of process_csv_data_with_histogram that uses NumPy arrays.
+    Gives the same results as the Python backend, which stays the reference.
+
+    Parameters:
+    file_name (str): Name of the CSV file to process.
+    stats (PipelineStats): Optional statistics, used by the Python backend when the file is handed to it.
+
+    Returns:
+    tuple: (outcomes, hourly_counts_elm, hourly_counts_hanley), outcomes is None on failure.
+    """
+    try:
+        if is_columnar_file(file_name):
+            data = load_columnar_columns(file_name)
+        else:
+            data = load_csv_columns(file_name)
+    except FileNotFoundError:
+        print(f"Error: File '{file_name}' not found.")
+        return None, {}, {}
+    except ValueError: # A speed that is not a number or a row with missing or extra fields
+        if is_columnar_file(file_name): # A damaged .tdc file, the Python backend could not read it either
+            raise
+        data = False
+
+    if data is False or (not is_columnar_file(file_name) and data is not None and has_malformed_categories(data)):
+        # The Python backend skips the malformed rows and quarantines them
+        print(f"Note: '{file_name}' has malformed rows, it is processed with the Python backend.")
+        return process_csv_data_with_histogram(file_name, stats=stats)
+    if data is None:
+        print(f"Error: The file '{file_name}' is empty or not formatted properly.")
+        return None, {}, {}
+    return compute_outcomes_columnar(data)
+
+def has_malformed_categories(data):
+    """
+    Checks the distinct values of the text columns loaded by load_csv_columns with the same
+    validation as parse_csv_rows, which only costs one check per distinct value.
+    """
+    checks = {"VehicleType": clean_required_category, "elctricHybrid": clean_electric, "JunctionName": clean_junction,
+              "timeOfDay": lambda value: clean_hour(value.split(":")[0])}
+    for name, check in checks.items():
+        for value in data[name][1]:
+            try:
+                check(value)
+            except ValueError:
+                return True
+    return False
+
+
+# Columnar storage format (.tdc)
+#
+# A survey day can be converted once into a compact binary file that is much faster
+# to read than CSV text. Layout:
+#   8 bytes magic "TRAFCOL1", 4 bytes header length (little endian), JSON header,
+#   then one fixed-width column after the other, each starting on an 8 byte boundary.
+# The header holds the row count, the byte order, the offset of every column and the
+# dictionaries that the coded columns refer to. Values are stored already normalised
+# (see parse_csv_rows), so reading a row is only a few list lookups.
+
+COLUMNAR_MAGIC = b"TRAFCOL1"
+COLUMNAR_EXTENSION = ".tdc"
+
+# (column name, array typecode) in the order of the normalised record tuple
+COLUMNAR_COLUMNS = (("vehicle_type", "H"), ("electric", "B"), ("junction", "H"), ("direction_in", "H"),
+                    ("direction_out", "H"), ("speed", "i"), ("speed_limit", "i"), ("hour", "B"), ("weather", "H"))
+
+# Dictionary used by each coded column, both directions share one dictionary
+COLUMN_DICTIONARIES = {"vehicle_type": "vehicle_type", "junction": "junction", "direction_in": "direction",
+                       "direction_out": "direction", "hour": "hour", "weather": "weather"}
+
+def is_columnar_file(file_name):
+    """
+    Checks if a file name refers to the columnar .tdc format.
+    """
+    return file_name.lower().endswith(COLUMNAR_EXTENSION)
+
+def align(offset, boundary=8):
+    """
+    Rounds an offset up to the next multiple of boundary.
+    """
+    return (offset + boundary - 1) // boundary * boundary
+
+def convert_csv_to_columnar(csv_file, columnar_file=None, block_size=65536):
+    """
+    Converts a traffic CSV file into the columnar .tdc format.
+    Columns are written to temporary files in blocks, so memory does not grow with the file.
+
+    Parameters:
+    csv_file (str): CSV file to convert.
+    columnar_file (str): Output file, by default the CSV name with the .tdc extension.
+    block_size (int): Number of rows buffered before a block is written.
+
+    Returns:
+    int: Number of rows converted.
+    """
+    if columnar_file is None:
+        columnar_file = os.path.splitext(csv_file)[0] + COLUMNAR_EXTENSION
+    dictionaries = {name: {} for name in set(COLUMN_DICTIONARIES.values())} # value -> code
+    limits = {name: 2 ** (8 * array.array(typecode).itemsize) for name, typecode in COLUMNAR_COLUMNS}
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(columnar_file))) as temp_dir:
+        parts = {name: open(os.path.join(temp_dir, name), 'wb') for name, typecode in COLUMNAR_COLUMNS}
+        blocks = {name: array.array(typecode) for name, typecode in COLUMNAR_COLUMNS}
+        coded = [(name, dictionaries[COLUMN_DICTIONARIES[name]] if name in COLUMN_DICTIONARIES else None)
+                 for name, typecode in COLUMNAR_COLUMNS]
+        rows = 0
+        quarantine = RowQuarantine(csv_file)
+        try:
+            for record in read_csv_records(csv_file, quarantine):
+                for (name, dictionary), value in zip(coded, record):
+                    if dictionary is not None: # Store the code of the value instead of the text
+                        value = dictionary.setdefault(value, len(dictionary))
+                        if value >= limits[name]:
+                            raise ValueError(f"Too many different values in column '{name}' of '{csv_file}'.")
+                    blocks[name].append(value)
+                rows += 1
+                if rows % block_size == 0:
+                    for name, block in blocks.items():
+                        block.tofile(parts[name])
+                        del block[:]
+            for name, block in blocks.items():
+                block.tofile(parts[name])
+        finally:
+            for part in parts.values():
+                part.close()
+            quarantine.close()
+            quarantine.report()
+
+        # The header stores offsets from the start of the column data
+        columns = {}
+        offset = 0
+        for name, typecode in COLUMNAR_COLUMNS:
+            size = os.path.getsize(os.path.join(temp_dir, name))
+            columns[name] = {"type": typecode, "offset": offset, "size": size}
+            offset = align(offset + size)
+        header = json.dumps({"version": 1, "rows": rows, "byteorder": sys.byteorder, "columns": columns,
+                             "dictionaries": {name: list(values) for name, values in dictionaries.items()}}).encode()
+
+        temp_file = columnar_file + ".tmp"
+        with open(temp_file, 'wb') as file:
+            file.write(COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header)
+            data_offset = align(file.tell())
+            for name, typecode in COLUMNAR_COLUMNS:
+                file.write(b"\0" * (data_offset + columns[name]["offset"] - file.tell())) # Padding
+                with open(os.path.join(temp_dir, name), 'rb') as part:
+                    shutil.copyfileobj(part, file)
+        os.replace(temp_file, columnar_file) # Never leave a half written file behind
+    return rows
+
+def read_columnar_header(buffer):
+    """
+    Reads the header of a columnar file.
+
+    Returns:
+    tuple: (header dictionary, offset where the column data starts)
+    """
+    if buffer[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar traffic data file.")
+    header_length = struct.unpack_from("<I", buffer, len(COLUMNAR_MAGIC))[0]
+    header_start = len(COLUMNAR_MAGIC) + 4
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("The columnar file was written on a machine with a different byte order.")
+    return header, align(header_start + header_length)
+
+def read_columnar_records(file_name):
+    """
+    Yields the normalised records of a columnar .tdc file.
+    The file is memory-mapped and each column is read through a memoryview of the map,
+    so no column is copied and the text values come from the shared dictionaries.
+
+    Parameters:
+    file_name (str): Columnar file to read.
+
+    Yields:
+    TrafficRecord: Same records as read_csv_records gives for the original CSV file.
+    """
+    with open(file_name, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) #https://docs.python.org/3/library/mmap.html
+    views = []
+    try:
+        buffer = memoryview(mapped)
+        views.append(buffer)
+        header, data_offset = read_columnar_header(buffer)
+        columns = []
+        for name, typecode in COLUMNAR_COLUMNS:
+            column = header["columns"][name]
+            start = data_offset + column["offset"]
+            raw = buffer[start:start + column["size"]]
+            views.append(raw)
+            columns.append(raw.cast(typecode))
+            views.append(columns[-1])
+
+        dictionaries = header["dictionaries"]
+        vehicle_types = dictionaries["vehicle_type"]
+        junctions = dictionaries["junction"]
+        directions = dictionaries["direction"]
+        hours = dictionaries["hour"]
+        weathers = dictionaries["weather"]
+        electric_values = (False, True)
+        make_record = TrafficRecord._make
+        for vehicle_type, electric, junction, direction_in, direction_out, speed, speed_limit, hour, weather in zip(*columns):
+            yield make_record((vehicle_types[vehicle_type], electric_values[electric], junctions[junction], directions[direction_in],
+                   directions[direction_out], speed, speed_limit, hours[hour], weathers[weather]))
+    finally:
+        for view in reversed(views): # The map can only be closed once every view is released
+            view.release()
+        mapped.close()
+
+def load_columnar_columns(file_name):
+    """
+    Loads a columnar .tdc file for the numpy backend without copying it.
+    The arrays are views of the memory-mapped file, in the same layout as load_csv_columns.
+
+    Returns:
+    dict: Columns as returned by load_csv_columns, or None if the file has no records.
+    """
+    if np is None:
+        raise ImportError("The numpy backend needs NumPy to be installed.")
+
+    with open(file_name, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) # Closed when the arrays are freed
+    header, data_offset = read_columnar_header(mapped)
+    if header["rows"] == 0:
+        return None
+
+    columns = {}
+    for name, typecode in COLUMNAR_COLUMNS:
+        column = header["columns"][name]
+        columns[name] = np.frombuffer(mapped, dtype=np.dtype(typecode), count=header["rows"], offset=data_offset + column["offset"])
+    dictionaries = header["dictionaries"]
+    return {"VehicleType": (columns["vehicle_type"], dictionaries["vehicle_type"]),
+            "elctricHybrid": (columns["electric"], ["false", "true"]),
+            "JunctionName": (columns["junction"], dictionaries["junction"]),
+            "travel_Direction_in": (columns["direction_in"], dictionaries["direction"]),
+            "travel_Direction_out": (columns["direction_out"], dictionaries["direction"]),
+            "Weather_Conditions": (columns["weather"], dictionaries["weather"]),
+            "timeOfDay": (columns["hour"], dictionaries["hour"]),
+            "VehicleSpeed": columns["speed"],
+            "JunctionSpeedLimit": columns["speed_limit"]}
+
+
+# Results cache
+
+# Raised whenever a change to the program gives other results for the same file (validation,
+# rounding, ...), so the cache entries made by the older program are not used any more
+CACHE_VERSION = 2
+
+class ResultsCache:
+    """
+    Keeps the outcomes and hourly counts of processed survey files on disk so that
+    a file is only parsed again when it changes.
+    Each entry is a JSON file named after the file path and its fingerprint (size,
+    modification time and a hash of the content), together with the version of the
+    results (CACHE_VERSION and the metric definitions). Once the folder grows over
+    max_bytes, the least recently used entries are removed.
+    """
+    def __init__(self, directory=".traffic_cache", max_bytes=50 * 1024 * 1024):
+        """
+        Initializes the cache in the given folder, which is created if needed.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Changing DEFAULT_METRICS changes the outcomes, so it is part of every key
+        metrics_hash = hashlib.sha1(json.dumps(DEFAULT_METRICS, sort_keys=True, default=sorted).encode()).hexdigest()
+        self.version = f"{CACHE_VERSION}|{metrics_hash}"
+        os.makedirs(directory, exist_ok=True)
+
+    def fingerprint(self, file_name):
+        """
+        Builds the cache key of a file from its path, size, modification time, content hash and the results version.
+        Returns None if the file does not exist.
+        """
+        try:
+            file_stat = os.stat(file_name)
+            content_hash = hashlib.blake2b()
+            with open(file_name, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b""):
+                    content_hash.update(block)
+        except FileNotFoundError:
+            return None
+        path_key = hashlib.sha1(os.path.abspath(file_name).encode()).hexdigest()[:16]
+        file_key = hashlib.sha1(f"{self.version}|{file_stat.st_size}|{file_stat.st_mtime_ns}|{content_hash.hexdigest()}".encode()).hexdigest()[:16]
+        return f"{path_key}-{file_key}"
+
+    def entry_path(self, key):
+        """
+        Returns the path of the JSON file that holds an entry.
+        """
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key):
+        """
+        Returns (outcomes, hourly_counts_elm, hourly_counts_hanley) stored under key, or None on a miss.
+        """
+        entry_path = self.entry_path(key) if key else None
+        try:
+            with open(entry_path, 'r') as file:
+                entry = json.load(file)
+        except (TypeError, OSError, ValueError): # No key, no entry or a damaged entry
+            self.misses += 1
+            return None
+        os.utime(entry_path) # Mark the entry as recently used
+        self.hits += 1
+        return TrafficOutcomes(*entry["outcomes"]), HourlyHistogram(entry["hourly_counts_elm"]), HourlyHistogram(entry["hourly_counts_hanley"])
+
+    def store(self, key, file_name, outcomes, hourly_counts_elm, hourly_counts_hanley):
+        """
+        Saves the results of a file under key. Older entries of the same file are removed
+        because the file or the program has changed since they were made.
+        """
+        if not key:
+            return
+        path_key = key.split("-")[0]
+        for entry_name in os.listdir(self.directory):
+            if entry_name.startswith(path_key + "-") and entry_name != key + ".json":
+                os.remove(os.path.join(self.directory, entry_name))
+
+        entry = {"file": os.path.abspath(file_name), "outcomes": list(outcomes),
+                 "hourly_counts_elm": dict(hourly_counts_elm), "hourly_counts_hanley": dict(hourly_counts_hanley)}
+        temp_path = self.entry_path(key) + f".{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temp_path, self.entry_path(key)) # Readers never see a half written entry
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for entry_name in os.listdir(self.directory):
+            if entry_name.endswith(".json"):
+                entry_stat = os.stat(os.path.join(self.directory, entry_name))
+                entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry_name))
+        total_bytes = sum(entry[1] for entry in entries)
+        for last_used, size, entry_name in sorted(entries): # Oldest first
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, entry_name))
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counts of this run.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0}
+
+    def report_stats(self):
+        """
+        Prints the cache statistics of this run.
+        """
+        stats = self.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions (hit rate {stats['hit_rate']:.0%})")
+
+def process_file_with_cache(file_name, cache, backend="python", stats=None):
+    """
+    Returns the outcomes and hourly counts of a file from the cache, processing it only on a miss.
+
+    Returns:
+    tuple: (outcomes, hourly_counts_elm, hourly_counts_hanley), outcomes is None on failure.
+    """
+    with (stats or NO_STATS).stage("cache"):
+        key = cache.fingerprint(file_name)
+        cached = cache.load(key)
+    if cached:
+        return cached
+    outcomes, hourly_counts_elm, hourly_counts_hanley = process_csv_data_with_histogram(file_name, backend, stats)
+    if outcomes:
+        cache.store(key, file_name, outcomes, hourly_counts_elm, hourly_counts_hanley)
+    return outcomes, hourly_counts_elm, hourly_counts_hanley
+
+
+# Task D
+try:
+    import tkinter as tk
+except ImportError: # Without Tk the histograms can still be saved as SVG files
+    tk = None
+
+HISTOGRAM_WIDTH = 1300
+HISTOGRAM_HEIGHT = 600
+ELM_COLOUR = "#96f997"
+HANLEY_COLOUR = "#f89796"
+
+def histogram_shapes(hourly_counts_elm, hourly_counts_hanley):
+    """
+    Works out the bars, values and hour labels of the histogram of both junctions.
+    The Tk window and the SVG file draw the same shapes, so both charts look the same.
+
+    Returns:
+    list: ("rectangle", x1, y1, x2, y2, fill) and ("text", x, y, text, font size, fill, anchor) tuples.
+    """
+    bar_width = 20
+    gap = 30
+    max_height = 400
+    x_start = 50
+    y_start = 500
+
+    # Find the maximum hourly traffic count for scaling
+    max_count = max(max(hourly_counts_elm.values(), default=0),
+                    max(hourly_counts_hanley.values(), default=0))
+
+    # Axis labels
+    shapes = [("text", 700, 550, "Hours 00:00 to 24:00", 12, "black", "center")]
+
+    for i in range(24):
+        hour = f"{i:02d}"
+        x = x_start + (bar_width + gap) * i
+
+        # Elm Avenue bar and value
+        elm_count = hourly_counts_elm.get(hour, 0)
+        elm_height = (elm_count / max_count) * max_height if max_count > 0 else 0
+        shapes.append(("rectangle", x, y_start - elm_height, x + bar_width, y_start, ELM_COLOUR))
+        shapes.append(("text", x + bar_width / 2, y_start - elm_height - 10, str(elm_count), 8, ELM_COLOUR, "center"))
+
+        # Hanley Highway bar and value
+        hanley_count = hourly_counts_hanley.get(hour, 0)
+        hanley_height = (hanley_count / max_count) * max_height if max_count > 0 else 0
+        shapes.append(("rectangle", x + bar_width, y_start - hanley_height, x + 2 * bar_width, y_start, HANLEY_COLOUR))
+        shapes.append(("text", x + bar_width + bar_width / 2, y_start - hanley_height - 10, str(hanley_count), 8, HANLEY_COLOUR, "center"))
+
+        # Hour label
+        shapes.append(("text", x + bar_width, y_start + 15, hour, 8, "black", "center"))
+    return shapes
+
+def legend_shapes(date):
+    """
+    Works out the title and the legend that tells which bar belongs to which junction.
+    """
+    return [
+        ("text", 242, 30, f"Histogram of Vehicle Frequency per Hour ({date})", 12, "black", "center"),
+        ("rectangle", 50, 50, 70, 70, ELM_COLOUR),
+        ("text", 90, 60, "Elm Avenue/Rabbit Road", 10, "black", "w"),
+        ("rectangle", 50, 80, 70, 100, HANLEY_COLOUR),
+        ("text", 90, 90, "Hanley HighwayWestway", 10, "black", "w"),
+    ]
+
+def histogram_svg(hourly_counts_elm, hourly_counts_hanley, date):
+    """
+    Draws the histogram of both junctions as an SVG image, no display is needed.
+
+    Returns:
+    str: The SVG document.
+    """
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{HISTOGRAM_WIDTH}" height="{HISTOGRAM_HEIGHT}" '
+             f'viewBox="0 0 {HISTOGRAM_WIDTH} {HISTOGRAM_HEIGHT}" font-family="Arial">',
+             '<rect width="100%" height="100%" fill="white"/>']
+    for shape in histogram_shapes(hourly_counts_elm, hourly_counts_hanley) + legend_shapes(date):
+        if shape[0] == "rectangle":
+            x1, y1, x2, y2, fill = shape[1:]
+            lines.append(f'<rect x="{x1:g}" y="{y1:g}" width="{x2 - x1:g}" height="{y2 - y1:g}" fill="{fill}" stroke="black"/>')
+        else:
+            x, y, text, size, fill, anchor = shape[1:]
+            text_anchor = "start" if anchor == "w" else "middle" # Tk anchors texts on their centre by default
+            lines.append(f'<text x="{x:g}" y="{y:g}" font-size="{size}pt" fill="{fill}" text-anchor="{text_anchor}" '
+                         f'dominant-baseline="central">{html.escape(text)}</text>')
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
+
+def histogram_file_name(directory, csv_file):
+    """
+    Returns the SVG file of a survey file's histogram, e.g. histograms/traffic_data15062024.svg.
+    """
+    return os.path.join(directory, os.path.splitext(os.path.basename(csv_file))[0] + ".svg")
+
+def save_histogram_svg(hourly_counts_elm, hourly_counts_hanley, date, file_name):
+    """
+    Saves the histogram as an SVG file. It is written to a temporary file first so a
+    half-written image is never left behind.
+
+    Returns:
+    str: The name of the saved file.
+    """
+    directory = os.path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_name + ".tmp", 'w') as file:
+        file.write(histogram_svg(hourly_counts_elm, hourly_counts_hanley, date))
+    os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+def has_display():
+    """
+    Checks if a Tk window can be opened (Tk is installed and there is a screen to show it on).
+    """
+    if tk is None:
+        return False
+    return os.name == "nt" or sys.platform == "darwin" or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+def show_histogram_window(hourly_counts_elm, hourly_counts_hanley, date):
+    """
+    Shows the histogram window until it is closed, runs in its own process (see open_histogram_window).
+    """
+    HistogramApp(hourly_counts_elm, hourly_counts_hanley, date).run()
+
+def open_histogram_window(hourly_counts_elm, hourly_counts_hanley, date):
+    """
+    Opens the histogram window in a separate process so the program can go on with the next file
+    while the window is open.
+
+    Returns:
+    multiprocessing.Process: The process of the window, it ends when the window is closed.
+    """
+    window = multiprocessing.Process(target=show_histogram_window, args=(hourly_counts_elm, hourly_counts_hanley, date))
+    window.start()
+    return window
+
+class HistogramApp:
+    """
+    Creates a histogram to visualize hourly traffic data for both junctions.
+    """
+    def __init__(self, hourly_counts_elm, hourly_counts_hanley, date, stats=None):
+        """ 
+        Initializes the app with traffic data and the date for the title.
+        stats is an optional PipelineStats that times the drawing as the "render" stage.
+        """
+        self.hourly_counts_elm = hourly_counts_elm
+        self.hourly_counts_hanley = hourly_counts_hanley
+        self.date = date
+        self.stats = stats or NO_STATS
+        self.root = tk.Tk()
+        self.canvas = None  # Will hold the canvas for drawing
+
+    def setup_window(self):
+        """
+        Sets up the Tkinter window and canvas for the histogram.
+        """
+        self.root.title(f"Histogram")
+        self.root.geometry(f"{HISTOGRAM_WIDTH}x{HISTOGRAM_HEIGHT}")
+        self.canvas = tk.Canvas(self.root, width=HISTOGRAM_WIDTH, height=HISTOGRAM_HEIGHT, bg="white")
+        self.canvas.pack()
+
+    def draw_shapes(self, shapes):
+        """
+        Draws shapes from histogram_shapes or legend_shapes on the canvas.
+        All the canvas commands are sent to Tcl as one script instead of one call per shape.
+        """
+        commands = []
+        for shape in shapes:
+            if shape[0] == "rectangle":
+                x1, y1, x2, y2, fill = shape[1:]
+                commands.append(f"{self.canvas} create rectangle {x1} {y1} {x2} {y2} -fill {fill} -outline black")
+            else:
+                x, y, text, size, fill, anchor = shape[1:]
+                commands.append(f"{self.canvas} create text {x} {y} -text {{{text}}} -font {{Arial {size}}} -fill {fill} -anchor {anchor}")
+        self.root.tk.eval("\n".join(commands))
+
+    def draw_histogram(self):
+        """
+        Draws the histogram with axes, labels, and bars.
+        """
+        self.draw_shapes(histogram_shapes(self.hourly_counts_elm, self.hourly_counts_hanley))
+
+    def add_legend(self):
+        """
+        Adds a legend to the histogram to indicate which bar corresponds to which junction.
+        """
+        self.draw_shapes(legend_shapes(self.date))
+
+    def run(self):
+        """
+        Runs the Tkinter main loop to display the histogram.
+        """
+        with self.stats.stage("render"):
+            self.setup_window()
+            self.draw_histogram()
+            self.add_legend()
+        self.root.mainloop()
+
+# Task E
+class MultiCSVProcessor:
+    def __init__(self, backend="python", cache=None, stats=None, histogram="window", histogram_dir="histograms", formats=("text",),
+                 results_file="results.txt"):
+        """
+        Initializes the application for processing multiple CSV files.
+        backend selects how files are processed: "python", "numpy" or "parallel".
+        cache is an optional ResultsCache that is checked before a file is processed.
+        stats is an optional PipelineStats, saved as run_stats.json next to results_file after every file.
+        histogram selects how the histogram is shown: "window" (does not wait for it to be closed),
+        "block" (waits for the window to be closed), "svg" (saved in histogram_dir) or "none".
+        formats are the formats the results are saved in, see ResultsWriter.
+        results_file is the text report the outcomes are appended to.
+        """
+        self.results_file = results_file  # Report file, the other formats are saved next to it
+        self.formats = formats  # Formats of the saved results
+        self.histogram = histogram  # How the histogram of a file is shown
+        self.histogram_dir = histogram_dir  # Folder of the SVG histograms
+        self.windows = []  # Processes of the histogram windows that are open
+        self.backend = backend  # Processing backend, extra aggregations need the "python" one.
+        self.cache = cache  # Results of files processed before, None disables caching.
+        self.stats = stats or NO_STATS  # Per-stage timings and counters of the run.
+        self.outcomes = None  # Stores processed outcomes (e.g., averages or summaries).
+        self.hourly_counts_elm = HourlyHistogram()  # Holds hourly traffic data for "Elm Avenue/Rabbit Road".
+        self.hourly_counts_hanley = HourlyHistogram()  # Holds hourly traffic data for "Hanley Highway/Westway".
+        self.csv_file = None  # Stores the name of the currently loaded CSV file.
+        self.aggregations = []  # Extra per-row aggregations added to every accumulator.
+        self.accumulator = None  # Accumulator of the last processed file.
+
+    def register_aggregation(self, name, update, initial=0):
+        """
+        Registers an extra per-row aggregation that is computed in the same pass as the outcomes.
+        The result can be read from self.accumulator.aggregation_results after each file.
+        """
+        self.aggregations.append((name, update, initial))
+
+    def load_csv_file(self, file_name, day, month, year):
+        """
+        Loads a CSV file, processes its data, and handles result display and visualization.
+        """
+        self.stats.start_file(file_name)
+        try:
+            # Process the file and extract necessary data in a single pass
+            if self.cache is not None and not self.aggregations: # Extra aggregations need a real pass
+                self.outcomes, self.hourly_counts_elm, self.hourly_counts_hanley = process_file_with_cache(file_name, self.cache, self.backend, self.stats)
+            elif self.backend != "python":
+                self.outcomes, self.hourly_counts_elm, self.hourly_counts_hanley = process_csv_data_with_histogram(file_name, self.backend, self.stats)
+            else:
+                self.accumulator = TrafficAccumulator()
+                for name, update, initial in self.aggregations:
+                    self.accumulator.register_aggregation(name, update, initial)
+                if self.accumulator.process_file(file_name, self.stats):
+                    self.outcomes = self.accumulator.outcomes()
+                    self.hourly_counts_elm = self.accumulator.hourly_counts_elm
+                    self.hourly_counts_hanley = self.accumulator.hourly_counts_hanley
+
+            if self.outcomes:  # Check if processing was successful
+                # Display outcomes
+                with self.stats.stage("display"):
+                    display_outcomes(self.outcomes, file_name)
+                
+                # Save results to a file
+                with self.stats.stage("report"):
+                    save_results_to_file(self.outcomes, fileName=self.results_file, csv_file=file_name, formats=self.formats)
+                
+                # Show histogram
+                self.show_histogram(file_name, f"{day:02d}/{month:02d}/{year}")
+                return True  # Indicate success
+            else:
+                print(f"Error: Failed to process data from file '{file_name}'.")
+                return False  # Indicate failure
+        except Exception as e:
+            print(f"An error occurred while processing file '{file_name}': {e}")
+            return False
+        finally:
+            self.stats.finish_file()
+            self.stats.write(self.results_file)
+
+    def show_histogram(self, file_name, date):
+        """
+        Shows the histogram of the processed file the way selected by self.histogram.
+        Without a display the window is replaced by an SVG file.
+        """
+        histogram = self.histogram
+        if histogram in ("window", "block") and not has_display():
+            print("No display available, the histogram is saved as an SVG file instead.")
+            histogram = "svg"
+
+        if histogram == "block":
+            histogram_app = HistogramApp(
+                self.hourly_counts_elm, self.hourly_counts_hanley, date, self.stats
+            )
+            histogram_app.run()
+        elif histogram == "window":
+            with self.stats.stage("render"):
+                self.windows.append(open_histogram_window(self.hourly_counts_elm, self.hourly_counts_hanley, date))
+        elif histogram == "svg":
+            with self.stats.stage("render"):
+                svg_file = save_histogram_svg(self.hourly_counts_elm, self.hourly_counts_hanley, date,
+                                              histogram_file_name(self.histogram_dir, file_name))
+            print(f"Histogram saved to {svg_file}")
+
+    def clear_previous_data(self):
+        """
+        Clears data from the previous run to process a new dataset.
+        """
+        self.outcomes = None
+        self.hourly_counts_elm.clear()
+        self.hourly_counts_hanley.clear()
+        self.csv_file = None  # Reset the file name
+        self.accumulator = None
+
+    def handle_user_interaction(self):
+        """
+        Handles user interaction for input validation and processing.
+        """
+        # Input validation for date
+        day, month, year = validate_day_month_year()
+        self.csv_file = f"traffic_data{day:02d}{month:02d}{year}.csv"  # Construct file name
+
+        # Load and process the file
+        if not self.load_csv_file(self.csv_file, day, month, year):
+            print(f"Error: Failed to process file '{self.csv_file}'. Please check if the file exists and is correctly formatted.")
+
+    def process_files(self):
+        """
+        Main loop for handling multiple CSV files until the user decides to quit.
+        """
+        print("Welcome to the Traffic Data Analysis Program!")
+        while True:
+            self.clear_previous_data()  # Clear previous data
+            self.handle_user_interaction()  # Handle current dataset
+
+            # Prompt to continue or exit
+            continue_choice = validate_continue_input()
+            if continue_choice == "N":
+                print("\nEnd of run. Goodbye!")
+                break
+
+        # Leave the histogram windows open until they are closed
+        self.windows = [window for window in self.windows if window.is_alive()]
+        if self.windows:
+            print("Close the histogram windows to exit.")
+        for window in self.windows:
+            window.join()
+
+
+# Task F: Batch processing of many survey days
+
+def date_from_file_name(file_name):
+    """
+    Reads the survey date from a file name such as traffic_data15062024.csv.
+
+    Returns:
+    datetime.date: The date, or None if the name does not contain a valid date.
+    """
+    match = re.search(r"traffic_data(\d{2})(\d{2})(\d{4})", os.path.basename(file_name))
+    if not match:
+        return None
+    day, month, year = (int(value) for value in match.groups())
+    try:
+        return datetime.date(year, month, day)
+    except ValueError: # e.g. 31/02
+        return None
+
+def files_for_date_range(start_date, end_date, directory=""):
+    """
+    Lists the survey files that exist for every date from start_date to end_date (both included).
+
+    Parameters:
+    start_date (datetime.date): First date of the range.
+    end_date (datetime.date): Last date of the range.
+    directory (str): Folder that holds the traffic_dataDDMMYYYY.csv files, "" for the current folder.
+
+    Returns:
+    list: File names in date order, missing days are skipped.
+    """
+    file_names = []
+    date = start_date
+    while date <= end_date:
+        file_name = os.path.join(directory, f"traffic_data{date.day:02d}{date.month:02d}{date.year}.csv")
+        if os.path.exists(file_name):
+            file_names.append(file_name)
+        date += datetime.timedelta(days=1)
+    return file_names
+
+def sort_by_survey_date(file_names):
+    """
+    Sorts file names by the survey date in their name, files without a date go last.
+    The file name breaks ties so the order is always the same.
+    """
+    return sorted(file_names, key=lambda file_name: (date_from_file_name(file_name) or datetime.date.max, file_name))
+
+def process_file_for_batch(file_name, backend="python"):
+    """
+    Worker used by run_batch: processes one file in a pool process.
+
+    Returns:
+    tuple: (file_name, outcomes, hourly_counts_elm, hourly_counts_hanley), outcomes is None on failure.
+    """
+    try:
+        outcomes, hourly_counts_elm, hourly_counts_hanley = process_csv_data_with_histogram(file_name, backend)
+    except Exception as e: # One bad file must not stop the rest of the batch
+        print(f"An error occurred while processing file '{file_name}': {e}")
+        return file_name, None, {}, {}
+    return file_name, outcomes, hourly_counts_elm, hourly_counts_hanley
+
+def run_batch(file_names, workers=None, results_file="results.txt", backend="python", cache=None, formats=("text",)):
+    """
+    Processes many survey files without any prompts or windows, spread over a pool of processes.
+    The report is written in survey date order whatever order the workers finish in.
+
+    Parameters:
+    file_names (list): CSV files to process.
+    workers (int): Number of processes, None uses one per CPU and 1 runs everything in this process.
+    results_file (str): Text report the outcomes are appended to.
+    backend (str): "python", "numpy" or "parallel" (only with workers=1, see below).
+    cache (ResultsCache): Optional cache, only the files it does not know are processed.
+    formats (tuple): Formats the results are saved in, see ResultsWriter.
+
+    Returns:
+    list: (file_name, outcomes, hourly_counts_elm, hourly_counts_hanley) for every file, in date order.
+    """
+    if backend == "parallel" and workers != 1:
+        # Every worker would start a pool of its own for the chunks of its file
+        raise ValueError('The "parallel" backend already processes each file on a pool, use it with workers=1.')
+    file_names = sort_by_survey_date(file_names)
+
+    # Look every file up in the cache first, only the misses go to the workers
+    results = {}
+    keys = {}
+    if cache is not None:
+        for file_name in file_names:
+            keys[file_name] = cache.fingerprint(file_name)
+            cached = cache.load(keys[file_name])
+            if cached:
+                results[file_name] = (file_name,) + tuple(cached)
+    missing = [file_name for file_name in file_names if file_name not in results]
+
+    if workers == 1:
+        processed = [process_file_for_batch(file_name, backend) for file_name in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor: #https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+            processed = list(executor.map(process_file_for_batch, missing, itertools.repeat(backend)))
+    for result in processed:
+        results[result[0]] = result
+        if cache is not None and result[1]:
+            cache.store(keys[result[0]], *result)
+    results = [results[file_name] for file_name in file_names]
+
+    with ResultsWriter(results_file, formats) as writer: # All the days are saved in one write
+        for file_name, outcomes, hourly_counts_elm, hourly_counts_hanley in results:
+            if outcomes:
+                writer.add(outcomes, file_name)
+            else:
+                print(f"Error: Failed to process data from file '{file_name}'.")
+    return results
+
+def render_histograms(results, directory="histograms"):
+    """
+    Saves the histograms of many days as SVG files, e.g. the results of run_batch.
+
+    Parameters:
+    results (list): (file_name, outcomes, hourly_counts_elm, hourly_counts_hanley) tuples.
+    directory (str): Folder the SVG files are saved in.
+
+    Returns:
+    list: Names of the saved SVG files.
+    """
+    svg_files = []
+    for file_name, outcomes, hourly_counts_elm, hourly_counts_hanley in results:
+        if not outcomes:
+            continue
+        survey_date = date_from_file_name(file_name)
+        date = f"{survey_date:%d/%m/%Y}" if survey_date else os.path.basename(file_name)
+        svg_files.append(save_histogram_svg(hourly_counts_elm, hourly_counts_hanley, date,
+                                            histogram_file_name(directory, file_name)))
+    return svg_files
+
+# Task G: Index over many survey days
+
+# Each index cell is a list of 24 * 8 counts: one slot per hour and per combination
+# of the electric, over speed and rain flags (slot = hour * 8 + electric * 4 + over_speed * 2 + rain)
+INDEX_SLOTS = 24 * 8
+
+def add_record_to_index(counts, record):
+    """
+    Aggregation registered on a TrafficAccumulator to build the index of one day.
+    Counts the record in counts[junction][vehicle_type] under its hour and flags.
+    """
+    vehicle_type, electric, junction, direction_in, direction_out, speed, speed_limit, hour, weather = record
+    hour_number = int(hour)
+    if 0 <= hour_number < 24:
+        cells = counts.setdefault(junction, {})
+        cell = cells.get(vehicle_type)
+        if cell is None:
+            cell = cells[vehicle_type] = [0] * INDEX_SLOTS
+        cell[hour_number * 8 + electric * 4 + (speed > speed_limit) * 2 + ("rain" in weather)] += 1
+    return counts
+
+def index_survey_file(file_name):
+    """
+    Worker used by TrafficIndex.update: processes one survey file and returns its outcomes and index counts.
+
+    Returns:
+    tuple: (file_name, outcomes, counts), outcomes is None on failure.
+    """
+    accumulator = TrafficAccumulator()
+    accumulator.register_aggregation("index", add_record_to_index, {})
+    try:
+        if not accumulator.process_file(file_name):
+            return file_name, None, {}
+    except Exception as e: # One bad file must not stop the rest of the index
+        print(f"An error occurred while processing file '{file_name}': {e}")
+        return file_name, None, {}
+    return file_name, accumulator.outcomes(), accumulator.aggregation_results["index"]
+
+class TrafficIndex:
+    """
+    Precomputed counts for many survey days, stored in one JSON file.
+    For every day, junction and vehicle type it keeps the number of vehicles per hour,
+    split by electric, over speed and rain, so questions across days are answered
+    without reading any survey file again.
+    """
+    def __init__(self, index_file="traffic_index.json"):
+        """
+        Loads the index from index_file if it exists.
+        """
+        self.index_file = index_file
+        self.days = {} # "YYYY-MM-DD" -> {"file", "size", "mtime_ns", "outcomes", "counts"}
+        if os.path.exists(index_file):
+            with open(index_file, 'r') as file:
+                self.days = json.load(file)["days"]
+        self.dates = sorted(self.days) # Sorted day keys for range searches
+
+    def update(self, file_names, workers=1):
+        """
+        Adds new survey files to the index and reprocesses files that changed since they were indexed.
+        Files without a date in their name are ignored. When a day has both a CSV and a .tdc file,
+        the .tdc file is used because it is faster to read.
+
+        Parameters:
+        file_names (list): Survey files to index.
+        workers (int): Number of processes, None uses one per CPU.
+
+        Returns:
+        int: Number of days that were (re)indexed.
+        """
+        files_by_day = {}
+        for file_name in sort_by_survey_date(file_names):
+            date = date_from_file_name(file_name)
+            if date is not None and (date.isoformat() not in files_by_day or is_columnar_file(file_name)):
+                files_by_day[date.isoformat()] = file_name
+
+        stale = [] # Files that are new or changed since they were indexed
+        for day, file_name in files_by_day.items():
+            file_stat = os.stat(file_name)
+            known = self.days.get(day)
+            if known is None or (known["file"], known["size"], known["mtime_ns"]) != (os.path.abspath(file_name), file_stat.st_size, file_stat.st_mtime_ns):
+                stale.append(file_name)
+
+        if workers == 1:
+            indexed = [index_survey_file(file_name) for file_name in stale]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                indexed = list(executor.map(index_survey_file, stale))
+
+        updated = 0
+        for file_name, outcomes, counts in indexed:
+            if outcomes:
+                file_stat = os.stat(file_name)
+                self.days[date_from_file_name(file_name).isoformat()] = {
+                    "file": os.path.abspath(file_name), "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+                    "outcomes": list(outcomes), "counts": counts} # TrafficOutcomes is not JSON serializable
+                updated += 1
+        self.dates = sorted(self.days)
+        return updated
+
+    def save(self):
+        """
+        Writes the index to its file, replacing the old one in a single step.
+        """
+        temp_file = self.index_file + ".tmp"
+        try:
+            with open(temp_file, 'w') as file:
+                json.dump({"version": 1, "days": self.days}, file)
+            os.replace(temp_file, self.index_file)
+        except BaseException:
+            if os.path.exists(temp_file): # Do not leave a half written index behind
+                os.remove(temp_file)
+            raise
+
+    def query(self, start_date, end_date, junction=None, vehicle_type=None, start_hour=0, end_hour=24,
+              electric=None, over_speed=None, rain=None, per_day=False):
+        """
+        Counts vehicles over a range of days from the index, e.g. trucks through
+        Hanley Highway/Westway between 07:00 and 09:00 over March 2024:
+        query(date(2024, 3, 1), date(2024, 3, 31), "Hanley Highway/Westway", "truck", 7, 9)
+
+        Parameters:
+        start_date, end_date (datetime.date): Days of the query, both included.
+        junction (str): Junction name, None for all junctions.
+        vehicle_type (str): Vehicle type in lower case (e.g. "truck"), None for all types.
+        start_hour, end_hour (int): Hours of the query, start included and end excluded.
+        electric, over_speed, rain (bool): Only count vehicles with this flag, None for both values.
+        per_day (bool): Return the count of every day instead of the total.
+
+        Returns:
+        int: Total count, or dict of "YYYY-MM-DD" -> count when per_day is True.
+        """
+        # Slots inside one hour that match the flags
+        flag_slots = [flags for flags in range(8)
+                      if (electric is None or bool(flags & 4) == electric)
+                      and (over_speed is None or bool(flags & 2) == over_speed)
+                      and (rain is None or bool(flags & 1) == rain)]
+        slots = [hour * 8 + flags for hour in range(max(start_hour, 0), min(end_hour, 24)) for flags in flag_slots]
+
+        results = {}
+        first = bisect.bisect_left(self.dates, start_date.isoformat()) #https://docs.python.org/3/library/bisect.html
+        last = bisect.bisect_right(self.dates, end_date.isoformat())
+        for day in self.dates[first:last]:
+            count = 0
+            for junction_name, cells in self.days[day]["counts"].items():
+                if junction is not None and junction_name != junction:
+                    continue
+                for type_name, cell in cells.items():
+                    if vehicle_type is None or type_name == vehicle_type:
+                        count += sum(cell[slot] for slot in slots)
+            results[day] = count
+        if per_day:
+            return results
+        return sum(results.values())
+
+
+# Task H: Following a survey file while it is being recorded
+
+class SurveyFileFollower:
+    """
+    Follows a survey CSV file that the counters keep appending to.
+    Every poll only reads the bytes added since the previous poll and adds the new rows
+    to a TrafficAccumulator, so the outcomes are always up to date without reading the
+    file again. A line is only used once its newline has been written.
+    """
+    def __init__(self, file_name, block_size=8 * 1024 * 1024):
+        """
+        Initializes the follower, the file does not have to exist yet.
+        block_size is the number of bytes read at a time, so a poll never holds more of a large file.
+        """
+        self.file_name = file_name
+        self.block_size = block_size
+        self.quarantine = None
+        self.reset()
+
+    def reset(self):
+        """
+        Starts again from the beginning of the file.
+        """
+        if self.quarantine is not None:
+            self.quarantine.discard() # The rows are quarantined again when they are read again
+        self.offset = 0 # Number of bytes of the file already read
+        self.pending = b"" # Start of a line whose newline has not been written yet
+        self.fieldnames = None # Header of the file
+        self.file_id = None # Device and inode, to notice when the file is replaced
+        self.rows = 0
+        self.lines = 0 # Lines of the file already parsed, for the line numbers of malformed rows
+        self.accumulator = TrafficAccumulator()
+        self.quarantine = RowQuarantine(self.file_name)
+
+    def poll(self, final=False):
+        """
+        Reads the bytes appended since the last poll and adds the complete rows.
+        final also uses a last line without newline, for when the file will not grow any more.
+
+        Returns:
+        int: Number of new rows.
+        """
+        try:
+            file_stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return 0
+        file_id = (file_stat.st_dev, file_stat.st_ino)
+        if self.file_id is not None and (file_id != self.file_id or file_stat.st_size < self.offset):
+            self.reset() # The file was replaced or truncated, read it again from the start
+        self.file_id = file_id
+
+        lines = self.new_lines(final)
+        if self.fieldnames is None:
+            for line in lines:
+                self.lines += 1
+                if line.strip(): # Skip blank lines before the header
+                    self.fieldnames = next(csv.reader([line]))
+                    break
+            if self.fieldnames is None:
+                return 0
+        self.accumulator.add_records(parse_csv_rows(lines, self.fieldnames, self.quarantine, self.lines + 1))
+        self.lines = self.quarantine.lines_read
+        rows = self.accumulator.engine.row_count()
+        new_rows = rows - self.rows
+        self.rows = rows
+        return new_rows
+
+    def new_lines(self, final=False):
+        """
+        Yields the complete lines added since the last poll, reading block_size bytes at a time.
+        A last line without newline is kept in self.pending for the next poll, unless final.
+        """
+        encoding = locale.getpreferredencoding(False) # Like open() in read_csv_records
+        with open(self.file_name, 'rb') as file:
+            file.seek(self.offset)
+            while True:
+                block = file.read(self.block_size)
+                if not block:
+                    break
+                self.offset += len(block)
+                block = self.pending + block
+                cut = block.rfind(b"\n") + 1
+                self.pending = block[cut:]
+                yield from io.StringIO(block[:cut].decode(encoding))
+        if final and self.pending:
+            line, self.pending = self.pending, b""
+            yield line.decode(encoding)
+
+def next_survey_file(file_name):
+    """
+    Returns the name of the survey file of the day after file_name, or None if file_name has no date.
+    """
+    date = date_from_file_name(file_name)
+    if date is None:
+        return None
+    date += datetime.timedelta(days=1)
+    extension = os.path.splitext(file_name)[1]
+    return os.path.join(os.path.dirname(file_name), f"traffic_data{date.day:02d}{date.month:02d}{date.year}{extension}")
+
+def finish_followed_file(follower, results_file, formats=("text",)):
+    """
+    Reads the rest of a followed file and saves its outcomes to the results file.
+    """
+    follower.poll(final=True)
+    follower.quarantine.close()
+    follower.quarantine.report()
+    if follower.rows:
+        save_results_to_file(follower.accumulator.outcomes(), fileName=results_file, csv_file=follower.file_name, formats=formats)
+
+def follow_survey_file(file_name, interval=1.0, idle_timeout=None, results_file="results.txt", on_update=None, formats=("text",)):
+    """
+    Follows a survey file while rows are appended and refreshes the outcomes after every poll
+    that found new rows, so the output is at most interval seconds behind the file.
+    When the file of the next day appears (midnight), the current day is finished,
+    saved to the results file and the new file is followed instead.
+
+    Parameters:
+    file_name (str): Survey file to follow.
+    interval (float): Seconds between two polls.
+    idle_timeout (float): Stop after this many seconds without new rows, None follows forever.
+    results_file (str): Text report the outcomes of finished days are appended to.
+    on_update (function): Called with the SurveyFileFollower after new rows, by default the outcomes are displayed.
+    formats (tuple): Formats the results are saved in, see ResultsWriter.
+
+    Returns:
+    SurveyFileFollower: The follower of the last file.
+    """
+    follower = SurveyFileFollower(file_name)
+    last_rows_time = time.monotonic()
+    try:
+        while True:
+            if follower.poll():
+                last_rows_time = time.monotonic()
+                if on_update is not None:
+                    on_update(follower)
+                else:
+                    display_outcomes(follower.accumulator.outcomes(), follower.file_name)
+
+            next_file = next_survey_file(follower.file_name)
+            if next_file is not None and os.path.exists(next_file): # The counters moved on to the next day
+                finish_followed_file(follower, results_file, formats)
+                follower = SurveyFileFollower(next_file)
+                last_rows_time = time.monotonic()
+                continue
+            if idle_timeout is not None and time.monotonic() - last_rows_time >= idle_timeout:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt: # Stopped by the user, the day so far is still saved
+        pass
+    finish_followed_file(follower, results_file, formats)
+    return follower
+
+
+# Task I: Local HTTP query service
+MAX_QUERY_DAYS = 366 # Longest date range of one request
+
+def parse_query_date(text):
+    """
+    Converts a date of a query, DD/MM/YYYY or YYYY-MM-DD, into a date.
+
+    Returns:
+    datetime.date: The date, or None if it is not a valid date.
+    """
+    for date_format in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except (TypeError, ValueError):
+            pass
+    return None
+
+class TrafficQueryService:
+    """
+    Local HTTP service that answers with the outcomes and hourly counts of survey days as JSON:
+
+    GET /day?date=15/06/2024             one day
+    GET /range?from=01/06/2024&to=30/06/2024   every day of the range that has a survey file
+    GET /health                          cache counters
+
+    Files are processed on a pool of processes. Requests that arrive while the same day
+    is being processed wait for that one computation instead of starting their own, and the
+    results of the last max_days days are kept in memory until their file changes.
+    """
+    def __init__(self, directory="", backend="python", workers=None, max_days=128):
+        """
+        Initializes the service for the survey files in directory.
+        workers is the number of processes, None uses one per CPU and 1 uses a thread of this process.
+        backend can't be "parallel", which would start a pool of processes for every request.
+        """
+        if backend == "parallel":
+            raise ValueError('The "parallel" backend can\'t be used by the query service, use "python" or "numpy".')
+        self.directory = directory
+        self.backend = backend
+        self.workers = workers
+        self.max_days = max_days
+        self.executor = None
+        self.days = collections.OrderedDict() # (file, size, mtime) -> result, least recently used first
+        self.in_flight = {} # (file, size, mtime) -> task of the computation running for it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def survey_file(self, survey_date):
+        """
+        Returns the file of a survey date, the columnar .tdc file when there is one, or None.
+        """
+        name = os.path.join(self.directory, f"traffic_data{survey_date.day:02d}{survey_date.month:02d}{survey_date.year}")
+        for file_name in (name + COLUMNAR_EXTENSION, name + ".csv"):
+            if os.path.exists(file_name):
+                return file_name
+        return None
+
+    async def day_result(self, survey_date):
+        """
+        Returns the result of a survey date from memory, from a computation that is already
+        running for it, or from a new computation on the pool.
+
+        Returns:
+        dict: The result, or None if there is no survey file for the date.
+        """
+        file_name = self.survey_file(survey_date)
+        if file_name is None:
+            return None
+        stat = os.stat(file_name)
+        key = (file_name, stat.st_size, stat.st_mtime_ns) # A file that changed is processed again
+
+        if key in self.days:
+            self.hits += 1
+            self.days.move_to_end(key)
+            return self.days[key]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self.compute(key, survey_date))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda finished: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task) # A client that disconnects does not cancel it for the others
+
+    async def compute(self, key, survey_date):
+        """
+        Processes a survey file on the pool and keeps the result in memory.
+        """
+        loop = asyncio.get_running_loop()
+        file_name, outcomes, hourly_counts_elm, hourly_counts_hanley = await loop.run_in_executor(
+            self.executor, process_file_for_batch, key[0], self.backend)
+        if not outcomes:
+            return {"date": survey_date.isoformat(), "file": file_name, "error": "the file is empty or could not be processed"}
+
+        result = {"date": survey_date.isoformat(), "file": file_name,
+                  "outcomes": dict(zip(OUTCOME_NAMES, outcomes)),
+                  "hourly_counts_elm": dict(hourly_counts_elm), "hourly_counts_hanley": dict(hourly_counts_hanley)}
+        self.days[key] = result
+        while len(self.days) > self.max_days:
+            self.days.popitem(last=False) # Forget the least recently used day
+        return result
+
+    async def answer(self, method, target):
+        """
+        Answers one request.
+
+        Returns:
+        tuple: (HTTP status, JSON body).
+        """
+        if method != "GET":
+            return 405, {"error": "only GET requests are supported"}
+        url = urllib.parse.urlsplit(target)
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return 200, {"status": "ok", "days": len(self.days), "in_flight": len(self.in_flight),
+                         "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+        if url.path == "/day":
+            survey_date = parse_query_date(query.get("date"))
+            if survey_date is None:
+                return 400, {"error": "date must be DD/MM/YYYY or YYYY-MM-DD"}
+            result = await self.day_result(survey_date)
+            if result is None:
+                return 404, {"error": f"no survey file for {survey_date.isoformat()}"}
+            return (500 if "error" in result else 200), result
+
+        if url.path == "/range":
+            start_date = parse_query_date(query.get("from"))
+            end_date = parse_query_date(query.get("to", query.get("from")))
+            if start_date is None or end_date is None or end_date < start_date:
+                return 400, {"error": "from and to must be dates (DD/MM/YYYY or YYYY-MM-DD), from before to"}
+            if (end_date - start_date).days >= MAX_QUERY_DAYS:
+                return 400, {"error": f"a range can have at most {MAX_QUERY_DAYS} days"}
+            dates = [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+            results = await asyncio.gather(*(self.day_result(survey_date) for survey_date in dates))
+            return 200, {"from": start_date.isoformat(), "to": end_date.isoformat(),
+                         "days": [result for result in results if result is not None]}
+
+        return 404, {"error": f"unknown path {url.path}, use /day, /range or /health"}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Reads the requests of one connection and writes the answers. Connections are kept
+        open between requests (HTTP/1.1 keep-alive) so load tests do not reconnect every time.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    status, body, keep_alive = 400, {"error": "malformed request"}, False
+                else:
+                    method, target, version = parts
+                    try:
+                        status, body = await self.answer(method, target)
+                    except Exception as e: # One failing request must not stop the service
+                        status, body = 500, {"error": str(e)}
+                    connection = headers.get("connection", "")
+                    keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+
+                payload = json.dumps(body).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError): # The client went away
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        """
+        Runs the service until it is cancelled. ready is called with the server once it listens.
+        """
+        if self.workers != 1: # With 1 worker the default thread pool of the event loop is used
+            # Forked workers would inherit the listening socket and the open client sockets, so
+            # a client would never see its connection closed. They are started from a clean process instead.
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method))
+        try:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            async with server:
+                if ready is not None:
+                    ready(server)
+                await server.serve_forever()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+def run_query_service(directory="", host="127.0.0.1", port=8080, workers=None, backend="python", max_days=128):
+    """
+    Starts the query service and runs it until Ctrl+C is pressed.
+    """
+    service = TrafficQueryService(directory, backend, workers, max_days)
+    ready = lambda server: print(f"Serving the survey files of '{directory or '.'}' on http://{host}:{server.sockets[0].getsockname()[1]}/ (Ctrl+C to stop)")
+    try:
+        asyncio.run(service.serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_survey_date(text):
+    """
+    Converts a DD/MM/YYYY argument of the command line into a date.
+    """
+    try:
+        return datetime.datetime.strptime(text, "%d/%m/%Y").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a date in the format DD/MM/YYYY")
+
+def main(arguments=None):
+    """
+    Runs the interactive program, or the batch mode when a date range or file pattern is given.
+    """
+    parser = argparse.ArgumentParser(description="Traffic Data Analysis Program")
+    parser.add_argument("--from", dest="start_date", type=parse_survey_date, help="first survey date DD/MM/YYYY (batch mode)")
+    parser.add_argument("--to", dest="end_date", type=parse_survey_date, help="last survey date DD/MM/YYYY (batch mode)")
+    parser.add_argument("--glob", dest="pattern", help="pattern of the survey files to process (batch mode)")
+    parser.add_argument("--dir", dest="directory", default="", help="folder of the survey files for --from/--to")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, one per CPU by default")
+    parser.add_argument("--backend", choices=("python", "numpy", "parallel"), default="python",
+                        help="\"parallel\" splits every file into chunks counted on one process per CPU")
+    parser.add_argument("--results", default="results.txt", help="report file the outcomes are appended to")
+    parser.add_argument("--formats", default="text", help="formats of the results, comma separated: text, csv, jsonl, columns")
+    parser.add_argument("--convert", metavar="PATTERN", help="convert matching CSV files to the columnar .tdc format")
+    parser.add_argument("--index", metavar="DIR", help="update the index of the survey files in DIR, with --from/--to query it")
+    parser.add_argument("--junction", help="junction of an index query, e.g. \"Hanley Highway/Westway\"")
+    parser.add_argument("--vehicle", help="vehicle type of an index query, e.g. truck")
+    parser.add_argument("--hours", default="00-24", help="hours of an index query, e.g. 07-09")
+    parser.add_argument("--follow", metavar="FILE", help="follow a survey file while it is being recorded")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two polls of --follow")
+    parser.add_argument("--idle-timeout", type=float, default=None, help="stop --follow after this many seconds without new rows")
+    parser.add_argument("--cache-dir", default=".traffic_cache", help="folder of the results cache")
+    parser.add_argument("--cache-size", type=int, default=50, help="maximum size of the results cache in MB")
+    parser.add_argument("--no-cache", action="store_true", help="always process the files again")
+    parser.add_argument("--cache-stats", action="store_true", help="print cache hits and misses at the end")
+    parser.add_argument("--stats", action="store_true", help="save per-stage timings to run_stats.json (or set TRAFFIC_STATS=1)")
+    parser.add_argument("--profile", action="store_true", help="add a cProfile capture to the run statistics")
+    parser.add_argument("--trace-memory", action="store_true", help="add tracemalloc peaks to the run statistics")
+    parser.add_argument("--serve", action="store_true", help="answer queries for the survey files in --dir over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address of --serve, only this computer by default")
+    parser.add_argument("--port", type=int, default=8080, help="port of --serve")
+    parser.add_argument("--max-days", type=int, default=128, help="days --serve keeps in memory")
+    parser.add_argument("--histogram", choices=("window", "block", "svg", "none"), default=None,
+                        help="how histograms are shown, \"window\" by default and \"none\" in batch mode")
+    parser.add_argument("--histogram-dir", default="histograms", help="folder of the SVG histograms")
+    args = parser.parse_args(arguments)
+    formats = tuple(result_format.strip() for result_format in args.formats.split(",") if result_format.strip())
+    for result_format in formats:
+        if result_format not in RESULT_FORMATS:
+            parser.error(f"unknown results format '{result_format}', use one of {', '.join(RESULT_FORMATS)}")
+    # "parallel" starts a pool for every file, which must not happen inside the pools of --serve and batch mode
+    if args.backend == "parallel" and args.serve:
+        parser.error("--backend parallel can't be used with --serve")
+    if args.backend == "parallel" and args.workers != 1 and (args.pattern is not None or args.start_date is not None) and args.index is None:
+        parser.error("--backend parallel already uses one process per chunk, use it with --workers 1 in batch mode")
+
+    if args.convert is not None:
+        for file_name in sorted(glob.glob(args.convert)):
+            rows = convert_csv_to_columnar(file_name)
+            print(f"Converted {file_name} ({rows} rows) to {os.path.splitext(file_name)[0] + COLUMNAR_EXTENSION}")
+        return
+
+    if args.follow is not None:
+        follow_survey_file(args.follow, args.interval, args.idle_timeout, args.results, formats=formats)
+        return
+
+    if args.serve:
+        run_query_service(args.directory, args.host, args.port, args.workers, args.backend, args.max_days)
+        return
+
+    if args.index is not None:
+        index = TrafficIndex(os.path.join(args.index, "traffic_index.json"))
+        file_names = glob.glob(os.path.join(args.index, "traffic_data*.csv")) + glob.glob(os.path.join(args.index, "traffic_data*" + COLUMNAR_EXTENSION))
+        updated = index.update(file_names, args.workers)
+        if updated:
+            index.save()
+        print(f"Index of {len(index.days)} days, {updated} updated")
+        if args.start_date is not None:
+            start_hour, end_hour = (int(hour) for hour in args.hours.split("-"))
+            count = index.query(args.start_date, args.end_date or args.start_date, args.junction,
+                                args.vehicle and args.vehicle.lower(), start_hour, end_hour)
+            print(f"Vehicles matching the query: {count}")
+        return
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultsCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    if args.pattern is None and args.start_date is None:
+        processor = MultiCSVProcessor(backend=args.backend, cache=cache, stats=PipelineStats.from_environment(args.stats, args.profile, args.trace_memory),
+                                      histogram=args.histogram or "window", histogram_dir=args.histogram_dir, formats=formats, results_file=args.results)
+        processor.process_files()
+        if cache is not None and args.cache_stats:
+            cache.report_stats()
+        return
+
+    file_names = []
+    if args.pattern is not None:
+        file_names.extend(glob.glob(args.pattern))
+    if args.start_date is not None:
+        file_names.extend(files_for_date_range(args.start_date, args.end_date or args.start_date, args.directory))
+    file_names = list(dict.fromkeys(file_names)) # Remove duplicates, keep the order
+    if not file_names:
+        print("Error: No survey files found for the given dates or pattern.")
+        return
+
+    results = run_batch(file_names, args.workers, args.results, args.backend, cache, formats)
+    processed = sum(1 for result in results if result[1])
+    print(f"Processed {processed} of {len(results)} files, results saved to {args.results}")
+    if args.histogram == "svg":
+        svg_files = render_histograms(results, args.histogram_dir)
+        print(f"Saved {len(svg_files)} histograms to {args.histogram_dir}")
+    if cache is not None and args.cache_stats:
+        cache.report_stats()
 
 
 if __name__ == "__main__":
-    processor = MultiCSVProcessor()
-    processor.process_files()
+    main()
 
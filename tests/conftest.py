@@ -0,0 +1,30 @@
+import csv
+import os
+import random
+import sys
+
+import pytest
+
+# Lets the tests import cw_a_b_c and benchmark from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_variant():
+    """
+    Returns write(source_file, variant_file, seed), which copies a survey file with the spacing
+    and case of the text values changed at random. Every reader and backend must clean them the same way.
+    """
+    def write(source_file, variant_file, seed):
+        generator = random.Random(seed)
+        changes = [str.upper, str.lower, str.title, lambda value: f" {value}", lambda value: f"{value}  ", lambda value: value]
+        with open(source_file, newline='') as source, open(variant_file, 'w', newline='') as variant:
+            writer = csv.writer(variant)
+            reader = csv.reader(source)
+            writer.writerow(next(reader))
+            for row in reader:
+                for column in (3, 4, 5, 8, 9): # Directions, weather, vehicle type and electric flag
+                    row[column] = generator.choice(changes)(row[column])
+                row[0] = generator.choice(changes[3:])(row[0]) # Junction names are only stripped
+                writer.writerow(row)
+    return write
@@ -0,0 +1,79 @@
+import pytest
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import PipelineStats, process_csv_data_with_histogram
+
+pytest.importorskip("numpy")
+
+FALLBACK_NOTE = "processed with the Python backend"
+
+
+def assert_backends_match(file_name, capsys):
+    python_results = process_csv_data_with_histogram(file_name)
+    numpy_results = process_csv_data_with_histogram(file_name, backend="numpy")
+    assert FALLBACK_NOTE not in capsys.readouterr().out # The numpy backend really did the work
+    assert python_results == numpy_results
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("rows", [1, 500, 20000])
+def test_generated_files(tmp_path, capsys, seed, rows):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, rows, seed=seed)
+    assert_backends_match(file_name, capsys)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_whitespace_and_case_variants(tmp_path, capsys, write_variant, seed):
+    source_file = str(tmp_path / "traffic_data15062024.csv")
+    variant_file = str(tmp_path / "traffic_data16062024.csv")
+    generate_traffic_csv(source_file, 5000, seed=seed)
+    write_variant(source_file, variant_file, seed)
+    assert_backends_match(variant_file, capsys)
+    assert process_csv_data_with_histogram(variant_file) == process_csv_data_with_histogram(source_file)
+
+
+@pytest.mark.parametrize("bad_row", [
+    "Elm Avenue/Rabbit Road,15/06/2024,24:10:00,N,S,Clear,20,28,Car,False", # Hour out of range
+    "Elm Avenue/Rabbit Road,15/06/2024,10:10:00,N,S,Clear,20,28,Car,Maybe", # Electric flag
+    "Elm Avenue/Rabbit Road,15/06/2024,10:10:00,N,S,Clear,20,fast,Car,False", # Speed
+    "Elm Avenue/Rabbit Road,15/06/2024,10:10:00,N,S,Clear,20,28,Car", # Missing field
+])
+def test_malformed_rows_fall_back_to_python(tmp_path, monkeypatch, capsys, bad_row):
+    # The numpy backend does not quarantine rows, a file with a malformed row is
+    # handed to the Python backend and the results only skip that row
+    monkeypatch.chdir(tmp_path)
+    clean_file = "traffic_data15062024.csv"
+    file_name = "traffic_data16062024.csv"
+    generate_traffic_csv(clean_file, 2000, seed=3)
+    with open(clean_file, newline='') as file:
+        lines = file.read().splitlines(keepends=True)
+    with open(file_name, 'w', newline='') as file:
+        file.writelines(lines[:1000] + [bad_row + "\r\n"] + lines[1000:])
+
+    numpy_results = process_csv_data_with_histogram(file_name, backend="numpy")
+    assert FALLBACK_NOTE in capsys.readouterr().out
+    assert numpy_results == process_csv_data_with_histogram(file_name) == process_csv_data_with_histogram(clean_file)
+
+
+def test_missing_column_is_not_a_malformed_row(tmp_path, capsys):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    with open(file_name, 'w') as file:
+        file.write("JunctionName,Date,timeOfDay\nElm Avenue/Rabbit Road,15/06/2024,08:00:00\n")
+    for backend in ("python", "numpy"):
+        with pytest.raises(KeyError):
+            process_csv_data_with_histogram(file_name, backend=backend)
+    assert FALLBACK_NOTE not in capsys.readouterr().out
+
+
+def test_fallback_keeps_the_statistics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_traffic_csv("traffic_data15062024.csv", 1000, seed=5)
+    with open("traffic_data15062024.csv", 'a', newline='') as file:
+        file.write("Elm Avenue/Rabbit Road,15/06/2024,24:10:00,N,S,Clear,20,28,Car,False\r\n")
+    stats = PipelineStats(enabled=True)
+    stats.start_file("traffic_data15062024.csv")
+    process_csv_data_with_histogram("traffic_data15062024.csv", backend="numpy", stats=stats)
+    stats.finish_file()
+    assert stats.files[0]["rows"] == 1000 and stats.files[0]["malformed_rows"] == 1
+    assert {"process", "parse", "evaluate"} <= set(stats.files[0]["stages"])
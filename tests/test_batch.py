@@ -0,0 +1,28 @@
+import pytest
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import TrafficQueryService, main, process_csv_data_with_histogram, run_batch
+
+
+def test_batch_results_are_in_date_order(tmp_path):
+    file_names = [str(tmp_path / f"traffic_data{day:02d}062024.csv") for day in (17, 15, 16)]
+    for seed, file_name in enumerate(file_names):
+        generate_traffic_csv(file_name, 1000, seed=seed)
+    results = run_batch(file_names, workers=2, results_file=str(tmp_path / "results.txt"))
+    assert [result[0] for result in results] == sorted(file_names)
+    assert all(result[1:] == process_csv_data_with_histogram(result[0]) for result in results)
+
+
+def test_parallel_backend_is_not_nested_in_a_pool(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 1000, seed=6)
+    with pytest.raises(ValueError):
+        run_batch([file_name], workers=2, results_file=str(tmp_path / "results.txt"), backend="parallel")
+    with pytest.raises(ValueError):
+        TrafficQueryService(str(tmp_path), backend="parallel")
+    with pytest.raises(SystemExit):
+        main(["--glob", file_name, "--backend", "parallel"])
+    with pytest.raises(SystemExit):
+        main(["--serve", "--backend", "parallel"])
+    results = run_batch([file_name], workers=1, results_file=str(tmp_path / "results.txt"), backend="parallel")
+    assert results[0][1:] == process_csv_data_with_histogram(file_name)
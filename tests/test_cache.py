@@ -0,0 +1,60 @@
+import os
+
+import cw_a_b_c
+from benchmark import generate_traffic_csv
+from cw_a_b_c import ResultsCache, process_csv_data_with_histogram, process_file_with_cache
+
+
+def test_hit_after_a_miss(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 1000, seed=11)
+    cache = ResultsCache(str(tmp_path / "cache"))
+    first = process_file_with_cache(file_name, cache)
+    second = process_file_with_cache(file_name, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first == second == process_csv_data_with_histogram(file_name)
+
+
+def test_changed_file_is_processed_again(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 1000, seed=11)
+    cache = ResultsCache(str(tmp_path / "cache"))
+    process_file_with_cache(file_name, cache)
+    generate_traffic_csv(file_name, 1200, seed=12)
+    outcomes = process_file_with_cache(file_name, cache)[0]
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert outcomes.total_vehicles == 1200
+    assert len(os.listdir(cache.directory)) == 1 # The entry of the old content is removed
+
+
+def test_entries_of_another_program_version_are_not_used(tmp_path, monkeypatch):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 1000, seed=11)
+    process_file_with_cache(file_name, ResultsCache(str(tmp_path / "cache")))
+
+    monkeypatch.setattr(cw_a_b_c, "CACHE_VERSION", cw_a_b_c.CACHE_VERSION + 1)
+    cache = ResultsCache(str(tmp_path / "cache"))
+    process_file_with_cache(file_name, cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    monkeypatch.setattr(cw_a_b_c, "DEFAULT_METRICS", cw_a_b_c.DEFAULT_METRICS + [{"name": "vans", "kind": "count", "where": {"vehicle_type": "van"}}])
+    cache = ResultsCache(str(tmp_path / "cache"))
+    process_file_with_cache(file_name, cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    file_names = [str(tmp_path / f"traffic_data{day}062024.csv") for day in (15, 16, 17)]
+    for day, file_name in enumerate(file_names):
+        generate_traffic_csv(file_name, 500, seed=day)
+    cache = ResultsCache(str(tmp_path / "cache"))
+    process_file_with_cache(file_names[0], cache)
+    entry_size = os.path.getsize(os.path.join(cache.directory, os.listdir(cache.directory)[0]))
+    cache.max_bytes = entry_size * 2 + entry_size // 2 # Room for two entries
+
+    process_file_with_cache(file_names[1], cache)
+    os.utime(cache.entry_path(cache.fingerprint(file_names[0])), ns=(1, 1)) # 15 was used long ago
+    process_file_with_cache(file_names[2], cache)
+    assert cache.evictions == 1
+    assert cache.load(cache.fingerprint(file_names[0])) is None
+    assert cache.load(cache.fingerprint(file_names[1])) is not None
@@ -0,0 +1,67 @@
+import os
+import pickle
+
+import pytest
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import csv_chunk_ranges, process_csv_chunk, process_csv_data_chunked, process_csv_data_with_histogram
+
+BAD_ROWS = {
+    # Line number in the file -> malformed row inserted there
+    40: "Elm Avenue/Rabbit Road,15/06/2024,25:00:00,N,S,Clear,20,28,Car,False",
+    2500: "Hanley Highway/Westway,15/06/2024,08:10:00,N,S,Clear,30,fast,Truck,False",
+    2501: "Hanley Highway/Westway,15/06/2024,08:10:00,N,S,Clear,30,31,Truck",
+    7000: "Elm Avenue/Rabbit Road,15/06/2024,17:00:00,N,S,Clear,20,28,,False",
+    11999: "Elm Avenue/Rabbit Road,15/06/2024,23:59:00,N,S,Clear,20,28,Scooter,Maybe",
+}
+
+
+def write_damaged_survey(file_name):
+    generate_traffic_csv(file_name, 12000, seed=10)
+    with open(file_name, newline='') as file:
+        lines = file.read().splitlines(keepends=True)
+    for line in sorted(BAD_ROWS):
+        lines.insert(line - 1, BAD_ROWS[line] + "\r\n")
+    with open(file_name, 'w', newline='') as file:
+        file.writelines(lines)
+
+
+@pytest.mark.parametrize("chunks", [2, 5, 16])
+def test_chunks_match_a_single_pass(tmp_path, chunks):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 20000, seed=chunks)
+    assert len(csv_chunk_ranges(file_name, chunks, min_bytes=1)[1]) == chunks
+    assert process_csv_data_chunked(file_name, workers=2, chunks=chunks, min_bytes=1) == process_csv_data_with_histogram(file_name)
+
+
+@pytest.mark.parametrize("chunks", [3, 7])
+def test_malformed_rows_keep_their_line_numbers(tmp_path, monkeypatch, chunks):
+    monkeypatch.chdir(tmp_path)
+    write_damaged_survey("traffic_data15062024.csv")
+    sequential = process_csv_data_with_histogram("traffic_data15062024.csv")
+    with open("quarantine/traffic_data15062024.csv") as file:
+        sequential_quarantine = file.read()
+
+    assert process_csv_data_chunked("traffic_data15062024.csv", workers=2, chunks=chunks, min_bytes=1) == sequential
+    with open("quarantine/traffic_data15062024.csv") as file:
+        chunked_quarantine = file.read()
+    assert chunked_quarantine == sequential_quarantine
+    assert [int(line.split(",")[0]) for line in chunked_quarantine.splitlines()[1:]] == sorted(BAD_ROWS)
+
+
+def test_damaged_chunks_do_not_send_their_rows_back(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_traffic_csv("traffic_data15062024.csv", 2000, seed=11)
+    with open("traffic_data15062024.csv", 'a', newline='') as file:
+        file.writelines(f"{BAD_ROWS[2500]}\r\n" for row in range(25000))
+    header, ranges = csv_chunk_ranges("traffic_data15062024.csv", 3, min_bytes=1)
+    os.mkdir("chunks")
+    result = process_csv_chunk("traffic_data15062024.csv", header, *ranges[-1], "chunks")
+    assert len(pickle.dumps(result)) < 10000 # Only the counts and the name of the chunk's quarantine file
+    assert os.path.exists(result[1])
+
+    assert process_csv_data_chunked("traffic_data15062024.csv", workers=2, chunks=3, min_bytes=1) == process_csv_data_with_histogram(
+        "traffic_data15062024.csv")
+    with open("quarantine/traffic_data15062024.csv") as file:
+        lines = [int(line.split(",")[0]) for line in file.read().splitlines()[1:]]
+    assert lines == list(range(2002, 27002))
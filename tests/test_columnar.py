@@ -0,0 +1,42 @@
+import pytest
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import convert_csv_to_columnar, np, process_csv_data_with_histogram
+
+BACKENDS = ["python", pytest.param("numpy", marks=pytest.mark.skipif(np is None, reason="NumPy is not installed"))]
+
+
+def assert_columnar_matches(csv_file, backend):
+    columnar_file = csv_file[:-len(".csv")] + ".tdc"
+    convert_csv_to_columnar(csv_file, block_size=1000) # Small blocks so the file has several of them
+    csv_results = process_csv_data_with_histogram(csv_file, backend)
+    assert process_csv_data_with_histogram(columnar_file, backend) == csv_results
+    assert csv_results == process_csv_data_with_histogram(csv_file) # And both match the Python reference
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", [0, 1])
+def test_generated_files(tmp_path, backend, seed):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 5000, seed=seed)
+    assert_columnar_matches(file_name, backend)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_whitespace_and_case_variants(tmp_path, write_variant, backend):
+    source_file = str(tmp_path / "traffic_data15062024.csv")
+    file_name = str(tmp_path / "traffic_data16062024.csv")
+    generate_traffic_csv(source_file, 5000, seed=3)
+    write_variant(source_file, file_name, 3)
+    assert_columnar_matches(file_name, backend)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_quarantined_rows_are_left_out(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    generate_traffic_csv("traffic_data15062024.csv", 3000, seed=4)
+    with open("traffic_data15062024.csv", 'a', newline='') as file:
+        file.write("Elm Avenue/Rabbit Road,15/06/2024,10:10:00,N,S,Clear,20,fast,Car,False\r\n")
+        file.write("Elm Avenue/Rabbit Road,15/06/2024,10:11:00,N,S,Clear,20,28,Car,False\r\n")
+    assert_columnar_matches("traffic_data15062024.csv", backend)
+    assert process_csv_data_with_histogram("traffic_data15062024.tdc", backend)[0].total_vehicles == 3001
@@ -0,0 +1,72 @@
+import locale
+import os
+import tracemalloc
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import SurveyFileFollower, TrafficAccumulator, process_csv_data
+
+HEADER = "JunctionName,Date,timeOfDay,travel_Direction_in,travel_Direction_out,Weather_Conditions,JunctionSpeedLimit,VehicleSpeed,VehicleType,elctricHybrid\n"
+ROW = "Elm Avenue/Rabbit Road,15/06/2024,08:{minute:02d}:00,N,S,Clear,20,28,Car,False\n"
+BAD_ROW = "Elm Avenue/Rabbit Road,15/06/2024,08:30:00,N,S,Clear,20,fast,Car,False\n"
+
+
+def test_rows_are_added_as_the_file_grows(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    with open(file_name, 'w') as file:
+        file.write(HEADER + ROW.format(minute=1) + ROW.format(minute=2)[:20]) # The last row is still being written
+    follower = SurveyFileFollower(file_name)
+    assert follower.poll() == 1
+    with open(file_name, 'a') as file:
+        file.write(ROW.format(minute=2)[20:] + ROW.format(minute=3))
+    assert follower.poll() == 2
+    assert follower.accumulator.outcomes().total_vehicles == 3
+
+
+def test_reading_again_leaves_no_quarantine_file_open(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("traffic_data15062024.csv", 'w') as file:
+        file.write(HEADER + BAD_ROW * 20000) # Enough rows for the quarantine to start its temporary file
+    follower = SurveyFileFollower("traffic_data15062024.csv")
+    follower.poll()
+    old_quarantine = follower.quarantine
+    with open("traffic_data15062024.csv", 'w') as file: # Replaced by a shorter file
+        file.write(HEADER + ROW.format(minute=1))
+    assert follower.poll() == 1
+    assert old_quarantine.temp_file is None
+    assert os.listdir("quarantine") == []
+    follower.quarantine.close()
+
+
+def test_file_is_decoded_like_the_other_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr(locale, "getpreferredencoding", lambda do_setlocale=True: "latin-1")
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    with open(file_name, 'w', encoding="latin-1") as file:
+        file.write(HEADER + ROW.format(minute=1).replace("Clear", "Clair ensoleillé"))
+    follower = SurveyFileFollower(file_name)
+    assert follower.poll() == 1
+
+
+def test_lines_cut_by_blocks_give_the_same_outcomes(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 3000, seed=8)
+    follower = SurveyFileFollower(file_name, block_size=100)
+    assert follower.poll() == 3000
+    assert follower.accumulator.outcomes() == process_csv_data(file_name)
+
+
+def test_first_poll_of_a_large_file_uses_little_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_traffic_csv("traffic_data15062024.csv", 40000, seed=9)
+    follower = SurveyFileFollower("traffic_data15062024.csv", block_size=64 * 1024)
+    accumulator = TrafficAccumulator()
+    tracemalloc.start()
+    try:
+        accumulator.process_file("traffic_data15062024.csv")
+        streaming_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        assert follower.poll() == 40000
+        follower_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert follower_peak < streaming_peak + 1024 * 1024 # The file is about 3 MB
+    assert follower.accumulator.outcomes() == accumulator.outcomes()
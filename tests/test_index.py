@@ -0,0 +1,23 @@
+import datetime
+import os
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import TrafficIndex, process_csv_data
+
+
+def test_index_save_and_load(tmp_path):
+    survey_file = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(survey_file, 2000, seed=1)
+    index_file = str(tmp_path / "traffic_index.json")
+
+    index = TrafficIndex(index_file)
+    assert index.update([survey_file]) == 1
+    index.save()
+    assert not os.path.exists(index_file + ".tmp")
+
+    loaded = TrafficIndex(index_file)
+    assert loaded.days == index.days
+    assert loaded.days["2024-06-15"]["outcomes"] == list(process_csv_data(survey_file))
+    day = datetime.date(2024, 6, 15)
+    assert loaded.query(day, day) == index.query(day, day) == 2000
+    assert loaded.update([survey_file]) == 0 # Nothing changed since it was indexed
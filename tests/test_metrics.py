@@ -0,0 +1,30 @@
+import pytest
+
+from benchmark import generate_traffic_csv, make_metrics
+from cw_a_b_c import MetricEngine, TrafficAccumulator, read_records
+
+
+@pytest.mark.parametrize("field", ["electric", "rain", "over_speed", "no_turn"])
+def test_flag_fields_only_take_booleans(field):
+    with pytest.raises(ValueError, match=field):
+        MetricEngine([{"name": "flagged", "kind": "count", "where": {field: "false"}}])
+
+
+def test_filtered_counts(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 3000, seed=4)
+    records = list(read_records(file_name))
+    engine = MetricEngine([{"name": "not_electric", "kind": "count", "where": {"electric": False}},
+                           {"name": "elm_cars", "kind": "count", "where": {"junction": " Elm Avenue/Rabbit Road ", "vehicle_type": "CAR"}}])
+    engine.add_records(records)
+    results = engine.results()
+    assert results["not_electric"] == sum(1 for record in records if not record.electric)
+    assert results["elm_cars"] == sum(1 for record in records if record.junction == "Elm Avenue/Rabbit Road" and record.vehicle_type == "car")
+
+
+def test_extra_metrics_keep_the_outcomes(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 3000, seed=5)
+    default, extended = TrafficAccumulator(), TrafficAccumulator(metrics=make_metrics(50))
+    assert default.process_file(file_name) and extended.process_file(file_name)
+    assert default.outcomes() == extended.outcomes()
@@ -0,0 +1,31 @@
+import os
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import TrafficAccumulator, convert_csv_to_columnar
+
+
+def write_survey_with_bad_row(file_name):
+    generate_traffic_csv(file_name, 500, seed=2)
+    with open(file_name, 'a', newline='') as file:
+        file.write("Elm Avenue/Rabbit Road,15/06/2024,25:00:00,N,S,Clear,20,28,Car,False\n") # Hour 25 is invalid
+
+
+def test_bad_rows_are_quarantined_with_their_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey_with_bad_row("traffic_data15062024.csv")
+    accumulator = TrafficAccumulator()
+    assert accumulator.process_file("traffic_data15062024.csv")
+    assert accumulator.quarantine.count == 1
+    with open(os.path.join("quarantine", "traffic_data15062024.csv")) as file:
+        lines = file.read().splitlines()
+    assert len(lines) == 2 and lines[1].startswith("502,")
+
+
+def test_columnar_file_keeps_the_csv_quarantine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey_with_bad_row("traffic_data15062024.csv")
+    assert TrafficAccumulator().process_file("traffic_data15062024.csv")
+    convert_csv_to_columnar("traffic_data15062024.csv")
+    assert TrafficAccumulator().process_file("traffic_data15062024.tdc")
+    assert os.path.exists(os.path.join("quarantine", "traffic_data15062024.csv"))
+    assert not [name for name in os.listdir("quarantine") if name.endswith(".tmp")]
@@ -0,0 +1,38 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from cw_a_b_c import OUTCOME_NAMES, ResultsWriter, TrafficOutcomes
+
+
+def save_days(results_file, first_day, days, formats=("csv",)):
+    outcomes = TrafficOutcomes(*range(len(OUTCOME_NAMES)))
+    with ResultsWriter(results_file, formats) as writer:
+        for day in range(first_day, first_day + days):
+            writer.add(outcomes, f"traffic_data{day:02d}062024.csv")
+
+
+def test_csv_header_is_written_once(tmp_path):
+    results_file = str(tmp_path / "results.txt")
+    open(tmp_path / "results.csv", 'w').close() # An empty file still needs the header
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(save_days, [results_file] * 8, range(1, 25, 3), [3] * 8))
+
+    with open(tmp_path / "results.csv", newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["date", "file"] + list(OUTCOME_NAMES)
+    assert len(rows) == 25 and rows.count(rows[0]) == 1
+    assert sorted(row[0] for row in rows[1:]) == [f"2024-06-{day:02d}" for day in range(1, 25)]
+
+
+def test_damaged_results_file_is_left_as_it_was(tmp_path):
+    results_file = str(tmp_path / "results.txt")
+    with open(tmp_path / "results.columns.json", 'w') as file:
+        file.write('{"date": [') # Cut off by a crash
+    with pytest.raises(ValueError):
+        save_days(results_file, 1, 1, ("columns",))
+    assert sorted(os.listdir(tmp_path)) == ["results.columns.json", "results.columns.json.lock"]
+    with open(tmp_path / "results.columns.json") as file:
+        assert file.read() == '{"date": ['
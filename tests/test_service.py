@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+from benchmark import generate_traffic_csv
+from cw_a_b_c import TrafficQueryService, process_csv_data
+
+
+async def get(port, path):
+    """
+    Sends one GET request with Connection: close and returns the status and the JSON body.
+    Reading up to EOF fails the test by timing out if the server keeps the connection open.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), timeout=30)
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+async def run_service(service, client):
+    """
+    Runs the service on a free port while client(port) runs, then stops it.
+    """
+    ready = asyncio.get_running_loop().create_future()
+    task = asyncio.ensure_future(service.serve("127.0.0.1", 0, lambda server: ready.set_result(server.sockets[0].getsockname()[1])))
+    try:
+        return await client(await ready)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_concurrent_requests_share_one_computation(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 20000, seed=7)
+    service = TrafficQueryService(str(tmp_path), workers=2)
+
+    async def client(port):
+        return await asyncio.gather(*(get(port, "/day?date=15/06/2024") for request in range(10)))
+
+    responses = asyncio.run(run_service(service, client))
+    assert [status for status, body in responses] == [200] * 10
+    assert all(body["outcomes"] == process_csv_data(file_name).as_dict() for status, body in responses)
+    assert (service.misses, service.coalesced, service.hits) == (1, 9, 0)
+
+
+def test_least_recently_used_days_are_forgotten(tmp_path):
+    for day in (15, 16, 17):
+        generate_traffic_csv(str(tmp_path / f"traffic_data{day}062024.csv"), 500, seed=day)
+    service = TrafficQueryService(str(tmp_path), workers=1, max_days=2)
+
+    async def client(port):
+        for day in (15, 16, 15, 17): # 16 is the least recently used when 17 is added
+            assert (await get(port, f"/day?date={day}/06/2024"))[0] == 200
+        await get(port, "/day?date=15/06/2024")
+        await get(port, "/day?date=16/06/2024")
+        return await get(port, "/health")
+
+    status, health = asyncio.run(run_service(service, client))
+    assert health["days"] == 2
+    assert (health["misses"], health["hits"]) == (4, 2)
+
+
+def test_unknown_day_and_bad_request(tmp_path):
+    service = TrafficQueryService(str(tmp_path), workers=1)
+
+    async def client(port):
+        return [await get(port, "/day?date=01/01/2024"), await get(port, "/day?date=tomorrow"), await get(port, "/nothing")]
+
+    assert [status for status, body in asyncio.run(run_service(service, client))] == [404, 400, 404]
@@ -0,0 +1,56 @@
+import csv
+
+from benchmark import CSV_COLUMNS, generate_traffic_csv
+from cw_a_b_c import HourlyTopTracker, TrafficAccumulator
+
+# Vehicles per hour at Elm Avenue, in the order the hours first appear in the file
+ELM_HOURS = {"09": 5, "07": 5, "13": 3, "08": 7, "22": 3, "10": 1}
+
+
+def write_tied_survey(file_name):
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS)
+        for hour, vehicles in ELM_HOURS.items():
+            for vehicle in range(vehicles):
+                writer.writerow(["Elm Avenue/Rabbit Road", "15/06/2024", f"{hour}:{vehicle:02d}:00", "N", "S", "Clear", 20, 18, "Car", "False"])
+        for vehicle in range(20): # Another junction, busier than every Elm Avenue hour
+            writer.writerow(["Hanley Highway/Westway", "15/06/2024", "13:30:00", "E", "W", "Clear", 30, 25, "Van", "True"])
+
+
+def test_top_hours_of_a_junction(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    write_tied_survey(file_name)
+    accumulator = TrafficAccumulator()
+    assert accumulator.process_file(file_name)
+
+    # Ties keep the order in which the hours first appeared
+    assert accumulator.top_hours("Elm Avenue/Rabbit Road", 3) == [("08", 7), ("09", 5), ("07", 5)]
+    assert accumulator.top_hours("Elm Avenue/Rabbit Road", 5) == [("08", 7), ("09", 5), ("07", 5), ("13", 3), ("22", 3)]
+    assert accumulator.top_hours("Elm Avenue/Rabbit Road", 24) == [("08", 7), ("09", 5), ("07", 5), ("13", 3), ("22", 3), ("10", 1)]
+    assert accumulator.top_hours("Hanley Highway/Westway", 2) == [("13", 20)]
+    assert accumulator.top_hours("Elm Avenue/Rabbit Road") == [("08", 7)]
+    assert accumulator.top_hours("Nowhere Road", 3) == []
+
+
+def test_top_hours_agree_with_the_counts(tmp_path):
+    file_name = str(tmp_path / "traffic_data15062024.csv")
+    generate_traffic_csv(file_name, 5000, seed=12)
+    accumulator = TrafficAccumulator()
+    assert accumulator.process_file(file_name)
+    top = accumulator.top_hours("Hanley Highway/Westway", 30)
+    assert len(top) == 24
+    assert [count for hour, count in top] == sorted((count for hour, count in top), reverse=True)
+    assert sum(count for hour, count in top) == accumulator.outcomes().hanley_vehicles
+    assert top[0][1] == accumulator.outcomes().hanley_peak_vehicles
+
+
+def test_tracker_follows_the_maximum():
+    tracker = HourlyTopTracker()
+    for hour in ["07", "08", "07", "09", "08"]:
+        tracker.add(hour)
+    assert tracker.busiest() == (2, ["07", "08"])
+    tracker.add("09", 5)
+    assert tracker.busiest() == (6, ["09"])
+    assert tracker.top(0) == []
+    assert tracker.top(10) == [("09", 6), ("07", 2), ("08", 2)]